@@ -1,5 +1,10 @@
 import streamlit as st
 
+from pos.dataset import get_dataset
+from pos.ingest import ingest_incoming
+from pos.trace import debug_panel_enabled, page_trace, show_debug_panel, span
+from pos.warmup import preload_modules, schedule_warmup, warmup_status
+
 # ページ設定
 st.set_page_config(
     page_title="店舗売上分析システム",
@@ -18,4 +23,24 @@ pages = [
 ]
 
 pg = st.navigation(pages)
-pg.run()
\ No newline at end of file
+
+# 再実行ごとに処理時間を計測する（データの読み込みからページの表示まで）
+with page_trace(pg.title) as trace:
+    # 取り込みフォルダの新着POSデータを反映（差分のみ）
+    ingest_incoming()
+
+    # 最初のグラフ表示で使うモジュールを先に読み込んでおく
+    preload_modules()
+
+    # 新しい版のデータ（起動直後・取り込み後）なら、よく使われる表示を事前集計する
+    schedule_warmup(get_dataset())
+    warmup = warmup_status()
+    if warmup["total"] and warmup["finished"] is None:
+        st.sidebar.caption(f"集計を準備中（{warmup['done']}/{warmup['total']}）")
+
+    with span("page", pg.title):
+        pg.run()
+
+# 計測結果の表示（POS_DEBUG_PANEL=1 または ?debug=1 の場合）
+if debug_panel_enabled():
+    show_debug_panel(trace)
\ No newline at end of file
@@ -1,15 +1,16 @@
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
-import numpy as np
 
-# 定数の定義
-STORES = [{"id": "ALL", "name": "全店舗"}] + [
-    {"id": "S001", "name": "店舗A"},
-    {"id": "S002", "name": "店舗B"},
-    {"id": "S003", "name": "店舗C"},
-    {"id": "S004", "name": "店舗D"}
-]
+from pos.cache import cached_compare_periods
+from pos.dataset import get_dataset
+from pos.table import paged_table
+
+# 共有データセット（この再実行の間は同じ版を使う）
+dataset = get_dataset()
+
+# 店舗マスタ（IDから店舗名への変換は辞書で行う）
+store_master = dataset.masters.stores
 
 # 表示するカラムの定義
 columns = {
@@ -49,89 +50,68 @@ st.divider()
 # 店舗選択
 selected_store = st.selectbox(
     "店舗を選択",
-    options=[store["id"] for store in STORES],
-    format_func=lambda x: next((store["name"] for store in STORES if store["id"] == x), x),
+    options=["ALL", *store_master.ids],
+    format_func=lambda x: "全店舗" if x == "ALL" else store_master.label(x),
 )
 
-def generate_sample_data(data_type="store", selected_store_id=None, target_date=None):
-    stores = [
-        {"id": "S001", "name": "店舗A"},
-        {"id": "S002", "name": "店舗B"},
-        {"id": "S003", "name": "店舗C"},
-        {"id": "S004", "name": "店舗D"}
-    ]
-    
-    departments = [
-        {"id": "D001", "name": "食品"},
-        {"id": "D002", "name": "鮮魚"},
-        {"id": "D003", "name": "精肉"},
-        {"id": "D004", "name": "青果"},
-        {"id": "D005", "name": "惣菜"},
-        {"id": "D006", "name": "ベーカリー"}
-    ]
+def build_customer_data(selected_store_id=None, target_date=None):
+    """当日・月累計の客数と前年・前年同曜日の客数を集計する"""
+    if target_date is None:
+        target_date = datetime.now().date()
+    target_date = pd.Timestamp(target_date)
+    month_start = target_date.replace(day=1)
 
+    # 店舗が選択された場合は部門別、未選択時は店舗別に集計
     if selected_store_id:
-        items = departments
+        keys = ["部門ID", "部門名"]
+        stores = [store_master.name(selected_store_id)]
     else:
-        items = stores if data_type == "store" else departments
+        keys = ["店舗ID", "店舗名"]
+        stores = None
 
-    if target_date is None:
-        target_date = datetime.now().date()
-    
-    data = []
-    for item in items:
-        if selected_store_id and data_type == "store" and item["id"] != selected_store_id:
-            continue
-            
-        # 基準値の設定
-        base_customers = np.random.randint(500, 1000)
-        
-        # 当日データの生成
-        current_customers = base_customers + np.random.randint(-50, 50)
-        
-        # 前年データの生成
-        prev_year_customers = current_customers * (1 + np.random.uniform(-0.2, 0.2))
-        prev_year_same_day_customers = prev_year_customers * (1 + np.random.uniform(-0.1, 0.1))
-        
-        record = {
-            "id": item["id"],
-            "name": item["name"],
-            "currentCustomers": current_customers,
-            "totalCustomers": current_customers * 30,  # 仮の累計値
-            "prevYearCustomers": prev_year_customers,
-            "prevYearTotalCustomers": prev_year_customers * 30,  # 仮の累計値
-            "prevYearSameDayCustomers": prev_year_same_day_customers,
-            "prevYearSameDayTotalCustomers": prev_year_same_day_customers * 30  # 仮の累計値
-        }
-        data.append(record)
-    
-    return pd.DataFrame(data)
+    references = ["prev_year", "prev_year_same_weekday"]
+    daily = cached_compare_periods(
+        dataset, target_date, target_date,
+        references=references, by=keys, measures=["客数"], stores=stores
+    ).rename(columns={
+        "客数": "currentCustomers",
+        "前年客数": "prevYearCustomers",
+        "前年同曜日客数": "prevYearSameDayCustomers"
+    })
+    month_to_date = cached_compare_periods(
+        dataset, month_start, target_date,
+        references=references, by=keys, measures=["客数"], stores=stores
+    ).rename(columns={
+        "客数": "totalCustomers",
+        "前年客数": "prevYearTotalCustomers",
+        "前年同曜日客数": "prevYearSameDayTotalCustomers"
+    })
+
+    # 当日の実績がない項目は0とする
+    data = pd.merge(month_to_date, daily, on=keys, how="left")
+    daily_columns = ["currentCustomers", "prevYearCustomers", "prevYearSameDayCustomers"]
+    data[daily_columns] = data[daily_columns].fillna(0)
+    data = data.rename(columns=dict(zip(keys, ["id", "name"])))
+    return data[list(columns)]
 
 # データ表示
 if selected_store == "ALL":
     st.subheader("全店舗実績")
-    df_store = generate_sample_data(
-        data_type="store",
-        target_date=selected_date
-    )
+    df_store = build_customer_data(target_date=selected_date)
     
     # カラム名を日本語に変換
     df_store = df_store.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_store) * 35 + 50, 400)
-    
-    st.dataframe(
-        df_store.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_store, format_dict, key="store_table",
+        data_key=(dataset.version, selected_date),
     )
 else:
-    store_name = next((store["name"] for store in STORES if store["id"] == selected_store), "")
+    store_name = store_master.name(selected_store)
     st.subheader(f"{store_name}の部門別実績")
     
-    df_department = generate_sample_data(
-        data_type="department", 
+    df_department = build_customer_data(
         selected_store_id=selected_store,
         target_date=selected_date
     )
@@ -139,11 +119,8 @@ else:
     # カラム名を日本語に変換
     df_department = df_department.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_department) * 35 + 50, 400)
-    
-    st.dataframe(
-        df_department.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_department, format_dict, key="department_table",
+        data_key=(dataset.version, selected_date, selected_store),
     )
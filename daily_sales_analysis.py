@@ -1,15 +1,15 @@
 import streamlit as st
-from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
+from datetime import datetime
 
-# 定数の定義
-STORES = [{"id": "ALL", "name": "全店舗"}] + [
-    {"id": "S001", "name": "店舗A"},
-    {"id": "S002", "name": "店舗B"},
-    {"id": "S003", "name": "店舗C"},
-    {"id": "S004", "name": "店舗D"}
-]
+from pos.cache import cached_daily_kpis
+from pos.dataset import get_dataset
+from pos.table import paged_table
+
+# 共有データセット（この再実行の間は同じ版を使う）
+dataset = get_dataset()
+
+# 店舗マスタ（IDから店舗名への変換は辞書で行う）
+store_master = dataset.masters.stores
 
 # 表示するカラムの定義
 columns = {
@@ -83,117 +83,48 @@ st.divider()
 # 店舗選択
 selected_store = st.selectbox(
     "店舗を選択",
-    options=[store["id"] for store in STORES],
-    format_func=lambda x: next((store["name"] for store in STORES if store["id"] == x), x),
+    options=["ALL", *store_master.ids],
+    format_func=lambda x: "全店舗" if x == "ALL" else store_master.label(x),
 )
 
-# generate_sample_data関数を修正
-def generate_sample_data(data_type="store", selected_store_id=None, target_date=None):
-    # 店舗/部門の定義
-    stores = [
-        {"id": "S001", "name": "店舗A"},
-        {"id": "S002", "name": "店舗B"},
-        {"id": "S003", "name": "店舗C"},
-        {"id": "S004", "name": "店舗D"}
-    ]
-    
-    departments = [
-        {"id": "D001", "name": "食品"},
-        {"id": "D002", "name": "鮮魚"},
-        {"id": "D003", "name": "精肉"},
-        {"id": "D004", "name": "青果"},
-        {"id": "D005", "name": "惣菜"},
-        {"id": "D006", "name": "ベーカリー"}
-    ]
+def build_sales_data(selected_store_id=None, target_date=None):
+    """当日・月累計の売上KPIを店舗別（店舗選択時は部門別）に集計する"""
+    if target_date is None:
+        target_date = datetime.now().date()
 
-    # 選択されたアイテムの決定
+    # 店舗が選択された場合は部門別、未選択時は店舗別に集計
     if selected_store_id:
-        items = departments  # 店舗が選択された場合は部門データを表示
+        keys = ["部門ID", "部門名"]
+        stores = [store_master.name(selected_store_id)]
     else:
-        items = stores if data_type == "store" else departments
+        keys = ["店舗ID", "店舗名"]
+        stores = None
 
-    # データ生成の期間設定を修正
-    if target_date is None:
-        target_date = datetime.now().date()
-    
-    data = []
-    for item in items:
-        if selected_store_id and data_type == "store" and item["id"] != selected_store_id:
-            continue
-            
-        # 基準値の設定
-        base_sales = np.random.randint(800000, 1200000)
-        base_customers = np.random.randint(500, 1000)
-        base_sku = np.random.randint(300, 500)
-        
-        # 当日データの生成
-        current_sales = base_sales + np.random.randint(-100000, 100000)
-        budget = base_sales * 1.1
-        current_customers = base_customers + np.random.randint(-50, 50)
-        current_sku = base_sku + np.random.randint(-30, 30)
-        
-        # 前年データの生成
-        last_year_sales = current_sales * (1 + np.random.uniform(-0.2, 0.2))
-        last_year_same_day_sales = last_year_sales * (1 + np.random.uniform(-0.1, 0.1))
-        
-        record = {
-            "id": item["id"],
-            "name": item["name"],
-            # 売上関連
-            "currentSales": current_sales,
-            "totalSales": current_sales,
-            "budgetRatio": (current_sales / budget) * 100,
-            "totalBudgetRatio": (current_sales / budget) * 100,
-            # 前年比較
-            "lastYearSales": last_year_sales,
-            "totalLastYearSales": last_year_sales,
-            "lastYearSalesRatio": (current_sales / last_year_sales) * 100,
-            "totalLastYearSalesRatio": (current_sales / last_year_sales) * 100,
-            # 前年同曜日比較
-            "lastYearSameDaySales": last_year_same_day_sales,
-            "totalLastYearSameDaySales": last_year_same_day_sales,
-            "lastYearSameDaySalesRatio": (current_sales / last_year_same_day_sales) * 100,
-            "totalLastYearSameDaySalesRatio": (current_sales / last_year_same_day_sales) * 100,
-            # 客数関連
-            "currentCustomers": current_customers,
-            "totalCustomers": current_customers,
-            "averageSalePerCustomer": current_sales / current_customers,
-            "averageTotalSalePerCustomer": current_sales / current_customers,
-            # 商品関連
-            "currentStockKeepingUnit": current_sku,
-            "totalStockKeepingUnit": current_sku,
-            "currentStockKeepingUnitPrice": current_sales / current_sku,
-            "totalStockKeepingUnitPrice": current_sales / current_sku
-        }
-        data.append(record)
-    
-    return pd.DataFrame(data)
+    data = cached_daily_kpis(dataset, target_date, by=keys, stores=stores)
+    data = data.rename(columns={
+        **dict(zip(keys, ["id", "name"])),
+        **{name: key for key, name in columns.items()},
+    })
+    return data[list(columns)]
 
 # データ表示
 if selected_store == "ALL":
     st.subheader("全店舗実績")
-    df_store = generate_sample_data(
-        data_type="store",
-        target_date=selected_date
-    )
+    df_store = build_sales_data(target_date=selected_date)
     
     # カラム名を日本語に変換
     df_store = df_store.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_store) * 35 + 50, 400)
-    
-    st.dataframe(
-        df_store.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_store, format_dict, key="store_table",
+        data_key=(dataset.version, selected_date),
     )
 else:
-    store_name = next((store["name"] for store in STORES if store["id"] == selected_store), "")
+    store_name = store_master.name(selected_store)
     st.subheader(f"{store_name}の部門別実績")
     
-    df_department = generate_sample_data(
-        data_type="department", 
+    df_department = build_sales_data(
         selected_store_id=selected_store,
         target_date=selected_date
     )
@@ -201,11 +132,8 @@ else:
     # カラム名を日本語に変換
     df_department = df_department.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_department) * 35 + 50, 400)
-    
-    st.dataframe(
-        df_department.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_department, format_dict, key="department_table",
+        data_key=(dataset.version, selected_date, selected_store),
     ) 
\ No newline at end of file
@@ -2,16 +2,19 @@ import pandas as pd
 import streamlit as st
 from datetime import datetime
 
-df = pd.read_csv("data/pos_data.csv")
-stores = df["店舗名"].unique()
-departments = df["部門名"].unique()
+from pos.cache import cached_aggregate_range, cached_compare_periods
+from pos.dataset import get_dataset
+from pos.downsample import chart_point_budget, downsample_frame
+from pos.trace import span
+
+# 共有データセット（この再実行の間は同じ版を使う）
+dataset = get_dataset()
+stores = dataset.stores
+departments = dataset.departments
 
 # ヘッダーの表示
 st.header("ホーム")
 
-# データ読み込み後に日付をdatetime型に変換
-df["日付"] = pd.to_datetime(df["日付"])
-
 # 期間選択
 
 selected_dates = st.date_input(
@@ -47,66 +50,36 @@ with col2:
 # 区切り線を追加
 st.divider()
 
-# 日付範囲でフィルタリング（修正）
+# 集計条件
 start_date, end_date = selected_dates
-filtered_df = df[
-    (df["日付"] >= pd.Timestamp(start_date)) & 
-    (df["日付"] <= pd.Timestamp(end_date))
-]
-
-# 店舗・部門でフィルタリング
-if selected_stores:
-    filtered_df = filtered_df[filtered_df["店舗名"].isin(selected_stores)]
-if selected_departments:
-    filtered_df = filtered_df[filtered_df["部門名"].isin(selected_departments)]
-
-# 前月の日付範囲を取得
-prev_month_start = pd.Timestamp(start_date) - pd.DateOffset(months=1)
-prev_month_end = pd.Timestamp(end_date) - pd.DateOffset(months=1)
-
-# 前月データを取得
-filtered_prev_month_df = df[
-    (df["日付"] >= prev_month_start) & 
-    (df["日付"] <= prev_month_end)
-]
-
-# 前月も同じフィルター条件を適用
-if selected_stores:
-    filtered_prev_month_df = filtered_prev_month_df[filtered_prev_month_df["店舗名"].isin(selected_stores)]
-if selected_departments:
-    filtered_prev_month_df = filtered_prev_month_df[filtered_prev_month_df["部門名"].isin(selected_departments)]
-
-# 前月の日付を現在月に合わせる
-filtered_prev_month_df = filtered_prev_month_df.copy()
-filtered_prev_month_df["日付"] = filtered_prev_month_df["日付"] + pd.DateOffset(months=1)
-
-# 当月と前月の日次売上を集計
-daily_sales_current = filtered_df.groupby("日付")["売上金額"].sum().reset_index()
-daily_sales_prev_month = filtered_prev_month_df.groupby("日付")["売上金額"].sum().reset_index()
-daily_sales_prev_month.rename(columns={"売上金額": "前月売上金額"}, inplace=True)
-
-# 当月と前月のデータを結合
-daily_sales_combined = pd.merge(
-    daily_sales_current,
-    daily_sales_prev_month,
-    on="日付",
-    how="left"
-).fillna(0)
-
-# 前月比を計算
-daily_sales_combined["前月比"] = (
+filters = dict(stores=selected_stores, departments=selected_departments)
+
+# 当月と前月の日次売上を1回の集計で取得（前月の日付は当月の対応日にそろえる）
+daily_sales_combined = cached_compare_periods(
+    dataset,
+    start_date,
+    end_date,
+    references=["prev_month"],
+    by=["日付"],
+    measures=["売上金額"],
+    **filters
+)
+
+# 前月比を計算（キャッシュ上の結果は変更せず、列を追加した複製を作る）
+daily_sales_combined = daily_sales_combined.assign(前月比=(
     (daily_sales_combined["売上金額"] - daily_sales_combined["前月売上金額"])
     / daily_sales_combined["前月売上金額"].replace({0: pd.NA})
     * 100
-).fillna(0)
+).fillna(0))
 
 # 折れ線グラフの描画
 
 col1,col2,col3 = st.columns(3)
-# KPI集計値の計算
-total_sales = filtered_df["売上金額"].sum()
-total_customers = filtered_df["客数"].sum() 
-total_quantity = filtered_df["個数"].sum()
+# KPI集計値の計算（月次・週次集計表を優先して合算）
+totals = cached_aggregate_range(dataset, start_date, end_date, **filters).iloc[0]
+total_sales = totals["売上金額"]
+total_customers = totals["客数"]
+total_quantity = totals["個数"]
 
 # KPIカードの表示
 with col1:
@@ -129,34 +102,49 @@ with col3:
 
 
 st.subheader("期間推移（前月対比）")
-st.line_chart(
-    daily_sales_combined.set_index("日付")[["売上金額", "前月売上金額"]]
+# 長期間の場合はグラフ幅に見合った点数まで間引いて送る（列に分割しない全幅のグラフ）
+trend_chart_data = downsample_frame(
+    daily_sales_combined,
+    ["売上金額", "前月売上金額"],
+    max_points=chart_point_budget(fraction=1.0),
+    x="日付"
 )
+with span("render", "期間推移", rows=len(trend_chart_data)):
+    st.line_chart(
+        trend_chart_data.set_index("日付")[["売上金額", "前月売上金額"]]
+    )
 
 st.subheader("店舗比較")
-# 店舗×部門のクロス集計
-store_dept_sales = filtered_df.pivot_table(
-    values="売上金額",
-    index="店舗名",
-    columns="部門名",
-    aggfunc="sum"
-).reset_index()
-
-st.bar_chart(
-    store_dept_sales,
-    x="店舗名"
+# 店舗×部門の集計（両方のクロス集計表で共用、キャッシュも軸の順序によらず共有）
+store_dept_totals = cached_aggregate_range(
+    dataset, start_date, end_date, by=["店舗名", "部門名"], **filters
 )
-dept_store_sales = filtered_df.pivot_table(
-    values="売上金額",
-    index="部門名",
-    columns="店舗名",
-    aggfunc="sum"
-).reset_index()
+
+# 店舗×部門のクロス集計
+with span("aggregate", "ピボット", rows=len(store_dept_totals)):
+    store_dept_sales = store_dept_totals.pivot(
+        index="店舗名",
+        columns="部門名",
+        values="売上金額"
+    ).reset_index()
+
+with span("render", "店舗比較", rows=len(store_dept_sales)):
+    st.bar_chart(
+        store_dept_sales,
+        x="店舗名"
+    )
+with span("aggregate", "ピボット", rows=len(store_dept_totals)):
+    dept_store_sales = store_dept_totals.pivot(
+        index="部門名",
+        columns="店舗名",
+        values="売上金額"
+    ).reset_index()
 st.subheader("部門比較")
-st.bar_chart(
-    dept_store_sales,
-    x="部門名",
-)
+with span("render", "部門比較", rows=len(dept_store_sales)):
+    st.bar_chart(
+        dept_store_sales,
+        x="部門名",
+    )
 
 
 
@@ -1,15 +1,18 @@
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import datetime
 import pandas as pd
-import numpy as np
 
-# 定数の定義
-STORES = [{"id": "ALL", "name": "全店舗"}] + [
-    {"id": "S001", "name": "店舗A"},
-    {"id": "S002", "name": "店舗B"},
-    {"id": "S003", "name": "店舗C"},
-    {"id": "S004", "name": "店舗D"}
-]
+from pos.budget import daily_budget, load_budget
+from pos.dataset import get_dataset
+from pos.hourly import hourly_cube, hourly_exists
+from pos.table import paged_table
+from pos.trace import span
+
+# 共有データセット（この再実行の間は同じ版を使う）
+dataset = get_dataset()
+
+# 店舗マスタ（IDから店舗名への変換は辞書で行う）
+store_master = dataset.masters.stores
 
 # 表示するカラムの定義を更新
 columns = {
@@ -77,143 +80,109 @@ st.divider()
 # 店舗選択
 selected_store = st.selectbox(
     "店舗を選択",
-    options=[store["id"] for store in STORES],
-    format_func=lambda x: next((store["name"] for store in STORES if store["id"] == x), x),
+    options=["ALL", *store_master.ids],
+    format_func=lambda x: "全店舗" if x == "ALL" else store_master.label(x),
 )
 
-# generate_sample_data関数を修正
-def generate_sample_data(data_type="store", selected_store_id=None, target_date=None, hour=10):
-    # 店舗/部門の定義
-    stores = [
-        {"id": "S001", "name": "店舗A"},
-        {"id": "S002", "name": "店舗B"},
-        {"id": "S003", "name": "店舗C"},
-        {"id": "S004", "name": "店舗D"}
-    ]
-    
-    departments = [
-        {"id": "D001", "name": "食品"},
-        {"id": "D002", "name": "鮮魚"},
-        {"id": "D003", "name": "精肉"},
-        {"id": "D004", "name": "青果"},
-        {"id": "D005", "name": "惣菜"},
-        {"id": "D006", "name": "ベーカリー"}
-    ]
-
-    # 選択されたアイテムの決定
-    if selected_store_id:
-        items = departments  # 店舗が選択された場合は部門データを表示
-    else:
-        items = stores if data_type == "store" else departments
+# 時間帯別データがない場合は生成方法を案内して終了
+if not hourly_exists():
+    st.warning("時間帯別データがありません。python -m tools.generate_mock_data --hourly-only で"
+               "現在の日次データから作成してください。")
+    st.stop()
+
+def divide(numerator, denominator):
+    """割り算の結果を返す（分母が0の場合は欠損）"""
+    return numerator / denominator.where(denominator != 0)
 
-    # データ生成の期間設定を修正
+def load_cube(selected_store_id=None, target_date=None):
+    """指定日の 店舗×時（店舗選択時は 部門×時）の集計表と、行ごとの当日の予算を返す
+
+    集計表は日付ごとにキャッシュする。予算は月の予算の日割り（pos.budget）で、
+    集計表の行と同じ並びのSeries（予算がない行は欠損）。
+    """
     if target_date is None:
         target_date = datetime.now().date()
-    
-    data = []
-    for item in items:
-        if selected_store_id and data_type == "store" and item["id"] != selected_store_id:
-            continue
-            
-        # 時間帯による変動を考慮した基準値の設定
-        time_factor = 1.0
-        if 11 <= hour <= 14:  # ランチタイム
-            time_factor = 1.5
-        elif 17 <= hour <= 20:  # ディナータイム
-            time_factor = 1.8
-            
-        # 基準値の設定
-        base_sales = np.random.randint(800000, 1200000) * time_factor
-        base_customers = np.random.randint(500, 1000) * time_factor
-        base_sku = np.random.randint(300, 500) * time_factor
-        
-        # 当日データの生成
-        current_sales = base_sales + np.random.randint(-100000, 100000)
-        last_week_sales = current_sales * (1 + np.random.uniform(-0.2, 0.2))
-        budget = base_sales * 1.1
-        
-        record = {
-            "id": item["id"],
-            "name": item["name"],
-            # 売上関連
-            "currentSales": current_sales,
-            "lastWeekSales": last_week_sales,
-            "lastWeekRatio": (current_sales / last_week_sales) * 100,
-            "totalSales": current_sales * 1.5,
-            "totalLastWeekSales": last_week_sales * 1.5,
-            "totalLastWeekRatio": (current_sales * 1.5) / (last_week_sales * 1.5) * 100,
-            # 客数関連
-            "currentCustomers": base_customers,
-            "totalCustomers": base_customers * 1.5,
-            "averageSalePerCustomer": current_sales / base_customers,
-            # 商品関連
-            "currentStockKeepingUnit": base_sku,
-            "totalStockKeepingUnit": base_sku * 1.5,
-            "currentStockKeepingUnitPrice": current_sales / base_sku,
-            # 予算関連
-            "budgetRatio": (current_sales / budget) * 100
-        }
-        data.append(record)
-    
-    return pd.DataFrame(data)
+
+    # 店舗が選択された場合は部門別、未選択時は店舗別に集計
+    if selected_store_id:
+        keys = ["部門ID", "部門名"]
+        stores = [store_master.name(selected_store_id)]
+    else:
+        keys = ["店舗ID", "店舗名"]
+        stores = None
+    cube = hourly_cube(target_date, by=keys, stores=stores)
+    budget = daily_budget(load_budget(), target_date, keys, stores)["予算金額"]
+    return cube, budget.reindex(cube.index)
+
+def build_hourly_data(cube, budget, hour=10):
+    """集計表から指定時台の実績と前週同曜日の同じ時台の実績を取り出す
+
+    予算消化率は指定時台までの当日累計売上の、当日の予算に対する割合。
+    """
+    df = cube.xs(hour, axis=1, level="時").reset_index()
+    keys = cube.index.names
+    budget = pd.Series(budget.to_numpy(), index=df.index)
+    return pd.DataFrame({
+        "id": df[keys[0]].astype(str),
+        "name": df[keys[1]].astype(str),
+        # 売上関連
+        "currentSales": df["売上金額"],
+        "lastWeekSales": df["前週売上金額"],
+        "lastWeekRatio": divide(df["売上金額"], df["前週売上金額"]) * 100,
+        "totalSales": df["累計売上金額"],
+        "totalLastWeekSales": df["前週累計売上金額"],
+        "totalLastWeekRatio": divide(df["累計売上金額"], df["前週累計売上金額"]) * 100,
+        # 客数関連
+        "currentCustomers": df["客数"],
+        "totalCustomers": df["累計客数"],
+        "averageSalePerCustomer": divide(df["売上金額"], df["客数"]),
+        # 商品関連
+        "currentStockKeepingUnit": df["個数"],
+        "totalStockKeepingUnit": df["累計個数"],
+        "currentStockKeepingUnitPrice": divide(df["売上金額"], df["個数"]),
+        # 予算関連
+        "budgetRatio": divide(df["累計売上金額"], budget) * 100,
+    })
 
 # データ表示
 if selected_store == "ALL":
     st.subheader(f"全店舗実績 ({selected_hours}時台)")
-    df_store = generate_sample_data(
-        data_type="store",
-        target_date=selected_date,
-        hour=selected_hours
-    )
+    cube, budget = load_cube(target_date=selected_date)
+    df_store = build_hourly_data(cube, budget, hour=selected_hours)
     
     # カラム名を日本語に変換
     df_store = df_store.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_store) * 35 + 50, 400)
-    
-    st.dataframe(
-        df_store.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_store, format_dict, key="store_table",
+        data_key=(dataset.version, selected_date, selected_hours),
     )
     
     # 棒グラフの追加
     st.subheader("時間帯別売上推移")
     
-    # 全時間帯のデータを生成
-    hourly_data = []
-    for hour in range(10, 23):
-        df = generate_sample_data(
-            data_type="store",
-            target_date=selected_date,
-            hour=hour
-        )
-        total_sales = df['currentSales'].sum()
-        hourly_data.append({
-            'hour': f"{hour:02d}:00",
-            'sales': total_sales
-        })
-    
-    df_hourly = pd.DataFrame(hourly_data)
+    # 選択日の時間帯別の全店舗合計（同じ集計表から求める）
+    hourly_sales = cube['売上金額'].sum()
+    df_hourly = pd.DataFrame({
+        'hour': [f"{hour:02d}:00" for hour in hourly_sales.index],
+        'sales': hourly_sales.to_numpy(),
+    })
     
     # 棒グラフの描画
-    st.bar_chart(
-        df_hourly.set_index('hour'),
-        use_container_width=True,
-        height=400
-    )
+    with span("render", "時間帯別売上推移", rows=len(df_hourly)):
+        st.bar_chart(
+            df_hourly.set_index('hour'),
+            use_container_width=True,
+            height=400
+        )
 
 else:
-    store_name = next((store["name"] for store in STORES if store["id"] == selected_store), "")
+    store_name = store_master.name(selected_store)
     st.subheader(f"{store_name}の部門別実績 ({selected_hours}時台)")
     
-    df_department = generate_sample_data(
-        data_type="department", 
-        selected_store_id=selected_store,
-        target_date=selected_date,
-        hour=selected_hours
-    )
+    cube, budget = load_cube(selected_store_id=selected_store, target_date=selected_date)
+    df_department = build_hourly_data(cube, budget, hour=selected_hours)
     
     # グラフ用のデータを先に作成
     df_department_chart = df_department.set_index('name')[['currentSales']]
@@ -222,23 +191,20 @@ else:
     # カラム名を日本語に変換（データフレーム表示用）
     df_department = df_department.rename(columns=columns)
     
-    # 行数に応じて高さを計算
-    height = min(len(df_department) * 35 + 50, 400)
-    
-    # データフレーム表示
-    st.dataframe(
-        df_department.style.format(format_dict),
-        use_container_width=True,
-        height=height
+    # ページ単位で表示（並べ替えはサーバー側、書式化は表示する行だけ）
+    paged_table(
+        df_department, format_dict, key="department_table",
+        data_key=(dataset.version, selected_date, selected_hours, selected_store),
     )
     
     # 部門別の棒グラフ
     st.subheader(f"{store_name} 部門別売上比較 ({selected_hours}時台)")
     
     # 棒グラフの描画
-    st.bar_chart(
-        df_department_chart,
-        use_container_width=True,
-        height=400
-    ) 
+    with span("render", "部門別売上比較", rows=len(df_department_chart)):
+        st.bar_chart(
+            df_department_chart,
+            use_container_width=True,
+            height=400
+        ) 
     
\ No newline at end of file
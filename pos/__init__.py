@@ -0,0 +1,5 @@
+"""POSデータのアクセス・集計処理（各ページ共通）
+
+ページからは必要なサブモジュールを直接 import して使う。
+例: ``from pos.dataset import get_dataset``
+"""
@@ -0,0 +1,310 @@
+"""集計結果を提供するWeb API（FastAPI）
+
+各ページと同じ集計（ホームのKPI・期間推移・店舗×部門のクロス集計、
+日次売上・日次客数の表、カレンダーの日別合計）を、BIツールやほかの
+ダッシュボードから取得できるようにする。集計は pos.cache のキャッシュ付きの
+関数で行うため、同じ条件の問い合わせは集計し直さない。
+
+- 応答はJSON（{"columns": [...], "data": [[...], ...]} の形式）または
+  Arrow（IPCストリーム形式）。クエリの format=arrow か、Acceptヘッダーに
+  application/vnd.apache.arrow.stream を指定するとArrowで返す
+- ETag・Last-Modified はデータ（と予算）の版から決まる。If-None-Match・
+  If-Modified-Since が一致すれば集計せずに304を返す
+- 集計・変換はスレッドで実行し、イベントループを止めない
+
+起動方法（データディレクトリのあるディレクトリで実行）::
+
+    uvicorn pos.api:app --host 0.0.0.0 --port 8000
+
+データセットは列ファイル（pos.colstore）をメモリマップで共有するため、
+Streamlitのプロセスと同じマシンで動かしてもデータのメモリは増えない。
+取り込み（pos.ingest）はStreamlitのアプリが行い、APIはデータファイルの
+更新を検知して新しい版を読み込む。
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
+
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Path, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+
+from pos.budget import get_budget_version
+from pos.cache import cached_aggregate_range, cached_compare_periods, cached_daily_kpis
+from pos.calendar import daily_totals, month_range
+from pos.dataset import get_dataset
+
+# 応答の形式とメディアタイプ
+MEDIA_TYPES = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# 日次客数の比較期間（前年・前年同曜日）
+REFERENCES = ["prev_year", "prev_year_same_weekday"]
+
+# Streamlitの実行環境の外で使うため、実行コンテキストがない旨の警告は出さない
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(
+    logging.ERROR
+)
+
+app = FastAPI(title="店舗売上分析API")
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+def _timestamp(version):
+    """版（更新時刻のナノ秒-サイズ）の更新時刻（UNIX時刻）を返す"""
+    return int(str(version).split("-")[0]) / 1e9
+
+
+def _versions(dataset, budget):
+    """応答の内容を決める版のリスト（予算を使う場合は予算の版を含む）"""
+    versions = [dataset.version]
+    if budget:
+        versions.append(get_budget_version())
+    return versions
+
+
+def _etag(versions, path, params, fmt):
+    text = "|".join(map(str, [*versions, path, sorted(params.items()), fmt]))
+    return f'W/"{hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def _not_modified(request, etag, last_modified):
+    """条件付きリクエストの条件が一致するか（If-None-Match を優先する）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _format(request, fmt):
+    """応答の形式を返す（クエリの format、なければAcceptヘッダーで決める）"""
+    if fmt is not None:
+        return fmt
+    return "arrow" if MEDIA_TYPES["arrow"] in request.headers.get("accept", "") else "json"
+
+
+def serialize(df, fmt):
+    """DataFrameをJSONまたはArrow（IPCストリーム）のバイト列にする"""
+    if fmt == "arrow":
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    # 日付は YYYY-MM-DD の文字列にする
+    df = df.assign(**{
+        column: df[column].dt.strftime("%Y-%m-%d")
+        for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])
+    })
+    return df.to_json(orient="split", index=False, force_ascii=False).encode("utf-8")
+
+
+async def respond(request, fmt, params, compute, budget=False):
+    """compute(dataset) の結果を条件付きリクエストに対応して返す
+
+    params は結果を決める条件（既定値を補ったもの）で、版と合わせてETagにする。
+    """
+    dataset = await asyncio.to_thread(get_dataset)
+    fmt = _format(request, fmt)
+    versions = _versions(dataset, budget)
+    last_modified = max(_timestamp(version) for version in versions if version is not None)
+    headers = {
+        "ETag": _etag(versions, request.url.path, params, fmt),
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        # 毎回検証させる（データが更新されていなければ304）
+        "Cache-Control": "no-cache",
+        "Vary": "Accept",
+    }
+    if _not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+
+    def build():
+        return serialize(compute(dataset), fmt)
+
+    content = await asyncio.to_thread(build)
+    return Response(content, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def _period(start, end):
+    """期間（未指定時は当月1日〜当日）"""
+    today = pd.Timestamp.now().normalize()
+    start = today.replace(day=1) if start is None else pd.Timestamp(start)
+    end = today if end is None else pd.Timestamp(end)
+    if start > end:
+        raise HTTPException(422, "開始日が終了日より後です")
+    return start, end
+
+
+def _target_date(value):
+    return pd.Timestamp.now().normalize() if value is None else pd.Timestamp(value)
+
+
+def _store_keys(dataset, store_id):
+    """店舗IDの指定から (集計軸, 店舗名のリスト) を返す（未指定は店舗別、指定時は部門別）"""
+    if store_id is None:
+        return ["店舗ID", "店舗名"], None
+    master = dataset.masters.stores
+    if store_id not in set(master.ids.tolist()):
+        raise HTTPException(404, f"店舗が見つかりません: {store_id}")
+    return ["部門ID", "部門名"], [master.name(store_id)]
+
+
+# 各エンドポイントの共通のクエリ
+FORMAT = Query(
+    None, alias="format", pattern="^(json|arrow)$", description="応答の形式（json・arrow）"
+)
+DATE = Query(None, alias="date", description="対象日（未指定時は当日）")
+STORE_ID = Query(None, description="店舗ID（指定時は部門別）")
+STORES = Query(None, description="店舗名（複数指定可、未指定時は全店舗）")
+DEPARTMENTS = Query(None, description="部門名（複数指定可、未指定時は全部門）")
+
+
+@app.get("/version")
+async def version():
+    """データ・予算の版と更新時刻"""
+    dataset = await asyncio.to_thread(get_dataset)
+    return {
+        "version": dataset.version,
+        "budget_version": get_budget_version(),
+        "last_modified": formatdate(_timestamp(dataset.version), usegmt=True),
+        # DuckDB方式ではPOSデータを読み込まないため行数はない
+        "rows": None if dataset.df is None else len(dataset.df),
+    }
+
+
+@app.get("/home/kpis")
+async def home_kpis(request: Request, start: date | None = None, end: date | None = None,
+                    store: list[str] | None = STORES, department: list[str] | None = DEPARTMENTS,
+                    fmt: str | None = FORMAT):
+    """ホーム: 期間内の売上金額・客数・個数の合計"""
+    start, end = _period(start, end)
+    params = {"start": start, "end": end, "store": sorted(store or []),
+              "department": sorted(department or [])}
+    return await respond(request, fmt, params, lambda dataset: cached_aggregate_range(
+        dataset, start, end, stores=store, departments=department
+    ))
+
+
+@app.get("/home/trend")
+async def home_trend(request: Request, start: date | None = None, end: date | None = None,
+                     store: list[str] | None = STORES, department: list[str] | None = DEPARTMENTS,
+                     fmt: str | None = FORMAT):
+    """ホーム: 日別の売上金額と前月の対応日の売上金額・前月比（%）"""
+    start, end = _period(start, end)
+    params = {"start": start, "end": end, "store": sorted(store or []),
+              "department": sorted(department or [])}
+
+    def compute(dataset):
+        trend = cached_compare_periods(
+            dataset, start, end, references=["prev_month"], by=["日付"],
+            measures=["売上金額"], stores=store, departments=department,
+        )
+        previous = trend["前月売上金額"]
+        # 前月の売上がない日は欠損
+        return trend.assign(
+            前月比=(trend["売上金額"] - previous) / previous.where(previous != 0) * 100
+        )
+
+    return await respond(request, fmt, params, compute)
+
+
+@app.get("/home/pivot")
+async def home_pivot(request: Request, start: date | None = None, end: date | None = None,
+                     store: list[str] | None = STORES, department: list[str] | None = DEPARTMENTS,
+                     index: str = Query("store", pattern="^(store|department)$",
+                                        description="行にする軸（store・department）"),
+                     measure: str = Query("売上金額", pattern="^(売上金額|客数|個数)$"),
+                     fmt: str | None = FORMAT):
+    """ホーム: 店舗×部門（index=department の場合は部門×店舗）のクロス集計"""
+    start, end = _period(start, end)
+    params = {"start": start, "end": end, "store": sorted(store or []),
+              "department": sorted(department or []), "index": index, "measure": measure}
+    rows, columns = ("店舗名", "部門名") if index == "store" else ("部門名", "店舗名")
+
+    def compute(dataset):
+        totals = cached_aggregate_range(
+            dataset, start, end, by=["店舗名", "部門名"], stores=store, departments=department
+        )
+        pivot = totals.pivot(index=rows, columns=columns, values=measure).reset_index()
+        # Arrowの列名は文字列にする
+        pivot.columns = [str(column) for column in pivot.columns]
+        return pivot
+
+    return await respond(request, fmt, params, compute)
+
+
+@app.get("/daily/sales")
+async def daily_sales(request: Request, target_date: date | None = DATE,
+                      store_id: str | None = STORE_ID,
+                      fmt: str | None = FORMAT):
+    """日次売上実績: 当日・月累計の売上KPI（店舗別、店舗指定時は部門別）"""
+    target = _target_date(target_date)
+    params = {"date": target, "store_id": store_id}
+
+    def compute(dataset):
+        keys, stores = _store_keys(dataset, store_id)
+        return cached_daily_kpis(dataset, target, by=keys, stores=stores)
+
+    return await respond(request, fmt, params, compute, budget=True)
+
+
+@app.get("/daily/customers")
+async def daily_customers(request: Request, target_date: date | None = DATE,
+                          store_id: str | None = STORE_ID,
+                          fmt: str | None = FORMAT):
+    """日次客数実績: 当日・月累計の客数と前年・前年同曜日の客数（店舗別、店舗指定時は部門別）"""
+    target = _target_date(target_date)
+    params = {"date": target, "store_id": store_id}
+
+    def compute(dataset):
+        keys, stores = _store_keys(dataset, store_id)
+        daily = cached_compare_periods(
+            dataset, target, target, references=REFERENCES, by=keys,
+            measures=["客数"], stores=stores,
+        )
+        month_to_date = cached_compare_periods(
+            dataset, target.replace(day=1), target, references=REFERENCES, by=keys,
+            measures=["客数"], stores=stores,
+        )
+        daily_columns = [column for column in daily.columns if column not in keys]
+        month_to_date = month_to_date.rename(
+            columns={column: f"累計{column}" for column in daily_columns}
+        )
+        # 当日の実績がない項目は0とする
+        data = pd.merge(month_to_date, daily, on=keys, how="left")
+        data[daily_columns] = data[daily_columns].fillna(0).astype("int64")
+        return data[keys + daily_columns + [f"累計{column}" for column in daily_columns]]
+
+    return await respond(request, fmt, params, compute)
+
+
+@app.get("/calendar/{year_month}")
+async def calendar(request: Request,
+                   year_month: str = Path(pattern=r"^\d{4}-\d{2}$", description="年月（YYYY-MM）"),
+                   store_id: str | None = Query(None, description="店舗ID（未指定時は全店舗）"),
+                   fmt: str | None = FORMAT):
+    """日次売上カレンダー: 月内の日別の売上金額・客数・個数の合計"""
+    try:
+        start, end = month_range(year_month)
+    except ValueError:
+        raise HTTPException(422, f"年月が正しくありません: {year_month}")
+    params = {"year_month": year_month, "store_id": store_id}
+
+    def compute(dataset):
+        _, stores = _store_keys(dataset, store_id)
+        return daily_totals(dataset, start, end, stores=stores).reset_index()
+
+    return await respond(request, fmt, params, compute)
@@ -0,0 +1,47 @@
+"""集計の実行方式の切り替え
+
+期間集計・期間比較を、次のどちらの方式で実行するかを環境変数
+POS_QUERY_BACKEND で指定する（既定は pandas）。どちらも同じ結果を返す。
+
+- pandas: 読み込み済みの集計表（pos.rollup）から集計する
+- duckdb: POSデータファイルをDuckDBで直接集計する（pos.duckdb_query）
+"""
+import os
+
+from pos import compare, rollup
+from pos.schema import MEASURE_COLUMNS
+
+# 実行方式の一覧
+BACKENDS = ["pandas", "duckdb"]
+
+# 使用する実行方式
+QUERY_BACKEND = os.environ.get("POS_QUERY_BACKEND", "pandas")
+
+if QUERY_BACKEND not in BACKENDS:
+    raise ValueError(f"未対応の実行方式です: {QUERY_BACKEND}（{', '.join(BACKENDS)} のいずれか）")
+
+
+def aggregate_range(dataset, start, end, by=(), stores=None, departments=None,
+                    backend=None):
+    """期間内の合計を by の列ごとに返す（pos.rollup.aggregate_range と同じ結果）"""
+    if (backend or QUERY_BACKEND) == "duckdb":
+        from pos import duckdb_query
+        return duckdb_query.aggregate_range(dataset, start, end, by, stores, departments)
+    return rollup.aggregate_range(
+        dataset.rollups, start, end, by=by, stores=stores, departments=departments
+    )
+
+
+def compare_periods(dataset, start, end, references=("prev_month",), by=("日付",),
+                    stores=None, departments=None, measures=MEASURE_COLUMNS,
+                    backend=None):
+    """当期と比較期間の集計値を返す（pos.compare.compare_periods と同じ結果）"""
+    if (backend or QUERY_BACKEND) == "duckdb":
+        from pos import duckdb_query
+        return duckdb_query.compare_periods(
+            dataset, start, end, references, by, stores, departments, measures
+        )
+    return compare.compare_periods(
+        dataset.rollups, start, end, references=references, by=by,
+        stores=stores, departments=departments, measures=measures,
+    )
@@ -0,0 +1,70 @@
+"""売上予算データ
+
+店舗×部門×月の売上予算（data/pos_budget.csv）を読み込む。
+日ごとの予算は月の予算を日割りしたものとする。
+"""
+import os
+
+import pandas as pd
+import streamlit as st
+
+from pos.loader import get_data_version
+
+# 予算データファイルのパス
+BUDGET_PATH = "data/pos_budget.csv"
+
+# CSVファイルの列順
+BUDGET_COLUMNS = ["店舗ID", "店舗名", "部門ID", "部門名", "年月", "予算金額"]
+
+# 読み込み時の型定義
+BUDGET_DTYPES = {
+    "店舗ID": "category",
+    "店舗名": "category",
+    "部門ID": "category",
+    "部門名": "category",
+    "年月": "category",
+    "予算金額": "int64",
+}
+
+
+def get_budget_version(path=BUDGET_PATH):
+    """予算データの版を返す（ファイルがない場合はNone）"""
+    return get_data_version(path) if os.path.exists(path) else None
+
+
+def read_budget(path=BUDGET_PATH):
+    """予算データを読み込む"""
+    return pd.read_csv(path, dtype=BUDGET_DTYPES)
+
+
+# 全セッションで同じオブジェクトを共有する（st.cache_data のように呼び出しごとに複製しない）
+@st.cache_resource(show_spinner=False)
+def _load_budget(path, version):
+    return read_budget(path)
+
+
+def load_budget(path=BUDGET_PATH):
+    """予算データを返す（ファイルがない場合は空のDataFrame）
+
+    返すDataFrameは全セッションの共有オブジェクトなので変更しないこと。
+    """
+    version = get_budget_version(path)
+    if version is None:
+        return pd.DataFrame(
+            {column: pd.Series(dtype=dtype) for column, dtype in BUDGET_DTYPES.items()}
+        )
+    return _load_budget(path, version)
+
+
+def daily_budget(budget, date, by, stores=None):
+    """集計軸ごとの対象日の予算と、月初から対象日までの累計予算を返す
+
+    戻り値は by をインデックスとし、"予算金額"・"累計予算金額" の列を持つ。
+    """
+    date = pd.Timestamp(date)
+    rows = budget[budget["年月"] == date.strftime("%Y-%m")]
+    if stores:
+        rows = rows[rows["店舗名"].isin(stores)]
+    monthly = rows.groupby(list(by), observed=True)["予算金額"].sum()
+    per_day = monthly / date.days_in_month
+    return pd.DataFrame({"予算金額": per_day, "累計予算金額": per_day * date.day})
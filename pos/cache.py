@@ -0,0 +1,367 @@
+"""集計結果のLRUキャッシュ
+
+期間・店舗・部門などの条件を正規化したキー（店舗・部門は重複を除いて
+ソート、日付はISO形式の文字列）で集計結果を保持し、全セッションで共有する。
+上限は件数ではなくメモリ使用量（バイト数）で指定し、超えた分は最も古く
+使われた結果から削除する。上限は環境変数 POS_QUERY_CACHE_MB で変更できる。
+
+期間集計（aggregate）は集計軸の並び順を区別しないため、店舗×部門と
+部門×店舗のクロス集計は同じ結果を共有する。また、同じ期間でより細かい
+集計軸を持つ結果がキャッシュにあれば、そこから再集計して返す。
+
+キーにはデータセットの版を含むため、データ更新後の結果が古い版の結果と
+混ざることはない（古い版の結果はLRUで自然に削除される）。
+集計の実行方式（pos.backend）によらず結果は同じなので、キーには含めない。
+返すDataFrameは共有オブジェクトなので変更しないこと。
+
+キャッシュにない結果の集計は cached_query で行う。同じキーの集計が
+ほかのセッションで実行中の場合は新たに集計せず、その完了を待って同じ
+結果を受け取る（single-flight）。集計はスレッド数を制限した共有の
+スレッドプール（環境変数 POS_QUERY_WORKERS、既定は4とCPUコア数の小さい方）で
+実行するため、同時に多数のセッションが開かれても集計のCPU使用は制限される。
+cached_query の呼び出しは計測の区間（pos.trace）として、キャッシュの結果
+（hit/miss/coalesced）と結果の行数を記録する。
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from pos import backend
+from pos.budget import get_budget_version, load_budget
+from pos.kpi import daily_kpis
+from pos.schema import MEASURE_COLUMNS
+from pos.trace import annotate, attach, current_context, span
+
+# 集計の種類ごとの計測の区間の名前
+SPAN_NAMES = {
+    "aggregate": "aggregate",
+    "hourly": "aggregate",
+    "compare": "compare",
+    "kpi": "compare",
+}
+
+# キャッシュの上限（バイト数）
+QUERY_CACHE_BYTES = int(os.environ.get("POS_QUERY_CACHE_MB", "256")) * 1024 * 1024
+
+# 集計を実行するスレッド数
+QUERY_WORKERS = int(os.environ.get("POS_QUERY_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+QueryKey = namedtuple(
+    "QueryKey", ["kind", "version", "start", "end", "stores", "departments", "by", "extra"]
+)
+
+
+def _normalize_date(value):
+    return pd.Timestamp(value).date().isoformat()
+
+
+def _normalize_names(values):
+    return tuple(sorted(set(values))) if values else ()
+
+
+def make_key(kind, version, start, end, stores=None, departments=None, by=(), extra=()):
+    """条件を正規化したキャッシュキーを返す"""
+    return QueryKey(
+        kind,
+        version,
+        _normalize_date(start),
+        _normalize_date(end),
+        _normalize_names(stores),
+        _normalize_names(departments),
+        tuple(by),
+        tuple(extra),
+    )
+
+
+def _size_of(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    return 0
+
+
+class QueryCache:
+    """メモリ使用量を上限とするスレッドセーフなLRUキャッシュ"""
+
+    def __init__(self, max_bytes=QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """キーに対応する結果を返す（なければNone）"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def peek(self, key):
+        """キーに対応する結果を返す（なければNone、ヒット数・使用順は変えない）"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def find(self, predicate):
+        """条件を満たす最近使われた結果を (キー, 結果) で返す（なければNone）"""
+        with self._lock:
+            for key in reversed(self._entries):
+                if predicate(key):
+                    self._entries.move_to_end(key)
+                    return key, self._entries[key]
+        return None
+
+    def put(self, key, value):
+        """結果を登録し、上限を超えた分を古い順に削除する"""
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """件数・使用バイト数・ヒット数・ミス数を返す"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    """プロセス共有のキャッシュを返す"""
+    return QueryCache(QUERY_CACHE_BYTES)
+
+
+# バックグラウンドの集計（キャッシュの事前集計など）を実行中のスレッドの印
+_background = threading.local()
+
+
+@contextmanager
+def background_queries():
+    """この中で行う集計をバックグラウンドの集計として扱う
+
+    バックグラウンドの集計は QueryExecutor.interactive_pending の件数に含めず、
+    集計用のスレッドプールを使わずに呼び出し元のスレッドで実行する。
+    """
+    _background.active = True
+    try:
+        yield
+    finally:
+        _background.active = False
+
+
+class QueryExecutor:
+    """キャッシュにない結果を集計する（同じキーの同時実行は1回にまとめる）"""
+
+    def __init__(self, cache, max_workers=QUERY_WORKERS):
+        self.cache = cache
+        self.coalesced = 0
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="pos-query")
+        self._inflight = {}
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def run(self, key, compute):
+        """キーに対応する結果を返す（なければ compute() で集計してキャッシュに登録する）"""
+        result = self.cache.get(key)
+        if result is not None:
+            annotate(cache="hit")
+            return result
+        interactive = not getattr(_background, "active", False)
+        if interactive:
+            with self._lock:
+                self._waiting += 1
+        try:
+            return self._run(key, compute)
+        finally:
+            if interactive:
+                with self._lock:
+                    self._waiting -= 1
+
+    def _run(self, key, compute):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                # 待っている間にほかのスレッドが登録した場合
+                result = self.cache.peek(key)
+                if result is not None:
+                    annotate(cache="hit")
+                    return result
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            annotate(cache="coalesced")
+            return future.result()
+        annotate(cache="miss")
+
+        try:
+            if getattr(self._local, "worker", False) or getattr(_background, "active", False):
+                # 集計の中から呼ばれた場合はそのまま実行する（プールの枯渇を防ぐ）。
+                # バックグラウンドの集計も呼び出し元のスレッドで実行する
+                result = compute()
+            else:
+                result = self._pool.submit(
+                    self._call, get_script_run_ctx(suppress_warning=True), current_context(),
+                    compute,
+                ).result()
+            self.cache.put(key, result)
+            future.set_result(result)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return result
+
+    def _call(self, ctx, context, compute):
+        # 呼び出し元のセッションの実行コンテキスト（st.cache_* の利用のため）と
+        # 計測の状態を引き継ぐ
+        add_script_run_ctx(threading.current_thread(), ctx)
+        self._local.worker = True
+        try:
+            with attach(context):
+                return compute()
+        finally:
+            self._local.worker = False
+            add_script_run_ctx(threading.current_thread(), None)
+
+    def interactive_pending(self):
+        """画面表示のために集計を待っているスレッド数を返す"""
+        with self._lock:
+            return self._waiting
+
+    def stats(self):
+        """実行中の件数・まとめた件数・画面表示のために待っている件数を返す"""
+        with self._lock:
+            return {
+                "inflight": len(self._inflight),
+                "coalesced": self.coalesced,
+                "waiting": self._waiting,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_executor():
+    """プロセス共有の集計の実行器を返す"""
+    return QueryExecutor(get_query_cache(), QUERY_WORKERS)
+
+
+def cached_query(key, compute):
+    """キーに対応する結果をキャッシュから返す（なければ共有の実行器で集計する）"""
+    label = f"{key.kind}({'×'.join(key.by)})"
+    with span(SPAN_NAMES.get(key.kind, "aggregate"), label) as record:
+        result = get_query_executor().run(key, compute)
+        record["rows"] = len(result)
+    return result
+
+
+def _can_derive(key, candidate):
+    """candidate の結果を再集計して key の結果を作れるか"""
+    if candidate.kind != key.kind or candidate[1:4] != key[1:4] or candidate.extra != key.extra:
+        return False
+    needed = set(key.by)
+    for column, wanted, cached in (
+        ("店舗名", key.stores, candidate.stores),
+        ("部門名", key.departments, candidate.departments),
+    ):
+        if cached == wanted:
+            continue
+        # 絞り込みなしの結果から、集計軸の列で絞り込めれば再利用できる
+        if cached or column not in candidate.by:
+            return False
+        needed.add(column)
+    return candidate != key and needed <= set(candidate.by)
+
+
+def _derive(key, candidate, rows):
+    """より細かい結果 rows から key の結果を再集計する"""
+    if key.stores and not candidate.stores:
+        rows = rows[rows["店舗名"].isin(key.stores)]
+    if key.departments and not candidate.departments:
+        rows = rows[rows["部門名"].isin(key.departments)]
+    values = [column for column in rows.columns if column not in candidate.by]
+    if not key.by:
+        return rows[values].sum().to_frame().T
+    return rows.groupby(list(key.by), observed=True, sort=True)[values].sum().reset_index()
+
+
+def cached_aggregate_range(dataset, start, end, by=(), stores=None, departments=None):
+    """aggregate_range のキャッシュ付き版（列・行の並びは by の順）
+
+    キャッシュは集計軸をソートした順で持つため、by の順が異なる場合は列を
+    並べ替え、行を by の順にソートし直す（キャッシュなしの集計と同じ結果になる）。
+    """
+    cache = get_query_cache()
+    by = list(by)
+    key = make_key("aggregate", dataset.version, start, end, stores, departments, sorted(by))
+
+    def compute():
+        found = cache.find(lambda candidate: _can_derive(key, candidate))
+        if found is not None:
+            annotate(derived=True)
+            return _derive(key, *found)
+        return backend.aggregate_range(
+            dataset, start, end, by=key.by, stores=stores, departments=departments
+        )
+
+    result = cached_query(key, compute)
+    if list(key.by) == by:
+        return result
+    return result[by + MEASURE_COLUMNS].sort_values(by, kind="stable", ignore_index=True)
+
+
+def cached_compare_periods(dataset, start, end, references=("prev_month",), by=("日付",),
+                           stores=None, departments=None, measures=MEASURE_COLUMNS):
+    """compare_periods のキャッシュ付き版"""
+    key = make_key(
+        "compare", dataset.version, start, end, stores, departments, by,
+        extra=(tuple(references), tuple(measures)),
+    )
+    return cached_query(key, lambda: backend.compare_periods(
+        dataset, start, end, references=references, by=by,
+        stores=stores, departments=departments, measures=measures,
+    ))
+
+
+def cached_daily_kpis(dataset, date, by, stores=None):
+    """daily_kpis のキャッシュ付き版（予算データは pos.budget から読み込む）"""
+    key = make_key(
+        "kpi", dataset.version, date, date, stores, (), by, extra=(get_budget_version(),)
+    )
+    return cached_query(key, lambda: daily_kpis(
+        dataset, load_budget(), date, by, stores=stores, compare=backend.compare_periods
+    ))
@@ -0,0 +1,48 @@
+"""売上カレンダー（FullCalendar）のイベント
+
+日別の合計は年単位で1回の集計（pos.cache.cached_aggregate_range）で求めて
+キャッシュし、月の切り替え時はその結果から該当月の行を切り出すだけにする。
+イベントのリストは日付・金額の列から一括で組み立てる。
+"""
+import pandas as pd
+
+from pos.cache import cached_aggregate_range
+from pos.schema import MEASURE_COLUMNS
+
+# イベントの表示色
+EVENT_STYLE = {"backgroundColor": "#e6f3ff", "textColor": "#333333"}
+
+
+def month_range(year_month):
+    """年月（YYYY-MM）の初日と末日を返す"""
+    start = pd.Timestamp(f"{year_month}-01")
+    return start, start + pd.offsets.MonthEnd(0)
+
+
+def daily_totals(dataset, start, end, stores=None):
+    """期間内の全日の合計（売上金額・客数・個数）を日付をインデックスとして返す
+
+    集計は期間を含む年全体を対象に行い（結果はキャッシュされる）、実績の
+    ない日は0とする。stores は店舗名のリスト（未指定時は全店舗）。
+    """
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    totals = cached_aggregate_range(
+        dataset, start.replace(month=1, day=1), end.replace(month=12, day=31),
+        by=["日付"], stores=stores,
+    )
+    days = pd.date_range(start, end, name="日付")
+    return totals.set_index("日付")[MEASURE_COLUMNS].reindex(days, fill_value=0)
+
+
+def calendar_events(totals, measure="売上金額"):
+    """日別の合計からFullCalendarのイベントのリストを作る"""
+    dates = totals.index.strftime("%Y-%m-%d")
+    events = pd.DataFrame({
+        "id": dates,
+        "title": "¥" + totals[measure].map("{:,}".format).to_numpy(),
+        "start": dates,
+        "end": dates,
+        **EVENT_STYLE,
+    })
+    return events.to_dict("records")
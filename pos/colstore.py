@@ -0,0 +1,195 @@
+"""メモリマップした列ファイルによるデータセットの共有
+
+データセットの集計表を列ごとのNumPyファイル（.npy）に保存し、
+np.load(mmap_mode="r") で読み込む。DataFrameの列は列ファイルのメモリを
+そのまま参照する（コピーしない）ため、
+
+- データの実体はOSのページキャッシュにあり、プロセス内のセッションが
+  いくつあっても、同じマシンの複数のプロセスでも1つだけになる
+- 使われていない部分はOSがメモリから追い出し、再度使うときに読み込む
+- 再起動時はCSV・Parquetの読み込みと集計表の作成をせずに済む
+
+店舗・部門は整数コード（マスタ内の位置）の列1つで保存し、読み込み時に
+ID・名称の両方のカテゴリ型の列を同じコードの配列から作る。使ったマスタは
+一緒に保存するため、後からマスタファイルが変わってもコードはずれない。
+
+ディレクトリ構成::
+
+    data/pos_columns/
+        <データソースと版のハッシュ>/
+            _meta.json
+            daily/日付.npy, daily/店舗コード.npy, daily/部門コード.npy, daily/売上金額.npy, ...
+            weekly/...  monthly/...
+
+列ファイルは読み取り専用なので、読み込んだDataFrameは変更しないこと。
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from pos.master import Master, Masters
+
+# 列ファイルの保存先
+COLUMN_ROOT = os.environ.get("POS_COLUMN_ROOT", "data/pos_columns")
+
+# 保存内容の説明ファイル
+META_FILE = "_meta.json"
+
+# 店舗・部門のコードの列名（ID列の名前 → コード列の名前）
+CODE_COLUMNS = {"店舗ID": "店舗コード", "部門ID": "部門コード"}
+
+# ID列と対になる名称の列
+NAME_COLUMNS = {"店舗ID": "店舗名", "部門ID": "部門名"}
+
+
+def _digest(source, version, mode):
+    return hashlib.sha1(f"{source}|{version}|{mode}".encode("utf-8")).hexdigest()[:16]
+
+
+def store_dir(source, version, mode, root=COLUMN_ROOT):
+    """データソース・版・読み込み方式に対応する保存先を返す"""
+    return os.path.join(root, _digest(source, version, mode))
+
+
+def _write_table(frame, directory):
+    """DataFrameを列ファイルに保存し、列の構成を返す"""
+    os.makedirs(directory)
+    names = set(NAME_COLUMNS.values())
+    for column in frame.columns:
+        if column in names:
+            # 名称はID列と同じコードから復元する
+            continue
+        if column in CODE_COLUMNS:
+            values = frame[column].cat.codes.to_numpy()
+            filename = CODE_COLUMNS[column]
+        else:
+            values = frame[column].to_numpy()
+            filename = column
+        np.save(os.path.join(directory, f"{filename}.npy"), values, allow_pickle=False)
+    return list(frame.columns)
+
+
+def _read_table(directory, columns, masters):
+    """列ファイルをメモリマップしたDataFrameを返す"""
+    def load(filename):
+        # memmap のサブクラスのままだと演算結果にも引き継がれるため、通常の配列のビューにする
+        return np.load(os.path.join(directory, f"{filename}.npy"), mmap_mode="r").view(np.ndarray)
+
+    data = {}
+    for master in masters:
+        if master.id_column in columns:
+            codes = load(CODE_COLUMNS[master.id_column])
+            data[master.id_column], data[master.name_column] = master.decode(codes)
+    for column in columns:
+        if column not in data:
+            data[column] = load(column)
+    return pd.DataFrame({column: data[column] for column in columns}, copy=False)
+
+
+def _same_data(a, b):
+    """2つのDataFrameが同じ配列を参照しているか（数値列で判定する）"""
+    columns = [column for column in a.columns if column not in NAME_COLUMNS.values()
+               and column not in CODE_COLUMNS]
+    return list(a.columns) == list(b.columns) and len(a) == len(b) and all(
+        np.shares_memory(a[column].to_numpy(), b[column].to_numpy()) for column in columns
+    )
+
+
+def _aliases(tables):
+    """同じ配列を参照する表の対応（名前→保存する方の表の名前）を返す"""
+    aliases = {}
+    names = list(tables)
+    for i, name in enumerate(names):
+        for original in names[:i]:
+            if original not in aliases and _same_data(tables[original], tables[name]):
+                aliases[name] = original
+                break
+    return aliases
+
+
+def _master_to_json(master):
+    return {"ids": master.ids.tolist(), "names": master.names.tolist()}
+
+
+def write_column_store(source, version, mode, tables, masters, root=COLUMN_ROOT):
+    """データセットの表（名前→DataFrame）を列ファイルに保存する
+
+    同じ配列を参照するDataFrameが複数の名前で渡された場合は1回だけ保存する。
+    保存は一時ディレクトリに書いてから名前を変えて確定する。同じ版が保存済みの
+    場合は何もしない。同じデータソース・読み込み方式のほかの版の保存内容は
+    削除する（読み込み中のプロセスは削除後もマップ済みのファイルを参照できる）。
+    保存先を返す。
+    """
+    directory = store_dir(source, version, mode, root)
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        temporary = f"{directory}.tmp-{uuid.uuid4().hex}"
+        try:
+            aliases = _aliases(tables)
+            meta = {
+                "source": source,
+                "version": version,
+                "mode": mode,
+                "masters": {
+                    "stores": _master_to_json(masters.stores),
+                    "departments": _master_to_json(masters.departments),
+                },
+                "tables": {
+                    name: _write_table(frame, os.path.join(temporary, name))
+                    for name, frame in tables.items() if name not in aliases
+                },
+                "aliases": aliases,
+            }
+            with open(os.path.join(temporary, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(temporary, directory)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not os.path.exists(os.path.join(directory, META_FILE)):
+                raise
+    _remove_others(directory, source, mode, root)
+    return directory
+
+
+def _remove_others(keep, source, mode, root):
+    """同じデータソース・読み込み方式のほかの版の保存内容を削除する"""
+    for entry in os.scandir(root):
+        if not entry.is_dir() or entry.path == keep or ".tmp-" in entry.name:
+            continue
+        try:
+            with open(os.path.join(entry.path, META_FILE), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (meta.get("source"), meta.get("mode")) == (source, mode):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_column_store(source, version, mode, root=COLUMN_ROOT):
+    """保存済みの表を読み込む
+
+    (表の辞書, マスタ) を返す。保存されていない場合はNone。
+    """
+    directory = store_dir(source, version, mode, root)
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    stores = meta["masters"]["stores"]
+    departments = meta["masters"]["departments"]
+    masters = Masters(
+        Master(stores["ids"], stores["names"], "店舗ID", "店舗名"),
+        Master(departments["ids"], departments["names"], "部門ID", "部門名"),
+    )
+    tables = {
+        name: _read_table(os.path.join(directory, name), columns, masters)
+        for name, columns in meta["tables"].items()
+    }
+    for name, original in meta["aliases"].items():
+        tables[name] = tables[original]
+    return tables, masters
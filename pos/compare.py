@@ -0,0 +1,126 @@
+"""期間比較（前月・前年・前年同曜日）
+
+当期と任意の数の比較期間を、集計表から1回の連結・1回のgroupbyで集計し、
+当期の行に比較期間の値を横に並べた結果を返す。
+
+比較期間の日付は「当期のどの日に対応するか」（整列日付）に変換してから
+集計する。整列日付は集計表に含まれる日付の種類（ユニーク値）ごとに
+一度だけ計算し、各行へはインデックス参照で割り当てる。
+"""
+import numpy as np
+import pandas as pd
+
+from pos.rollup import slice_period, split_range
+from pos.schema import MEASURE_COLUMNS
+from pos.trace import span
+
+# 比較期間の定義（名前: (列名の接頭辞, 当期からのずれ)）
+COMPARISONS = {
+    "prev_month": ("前月", pd.DateOffset(months=1)),
+    "prev_year": ("前年", pd.DateOffset(years=1)),
+    # 52週前（曜日がそろう）
+    "prev_year_same_weekday": ("前年同曜日", pd.Timedelta(days=364)),
+}
+
+# 当期を表す内部の系列名
+CURRENT = "current"
+
+
+def comparison_columns(reference, measures=MEASURE_COLUMNS):
+    """比較期間の列名（例: 前月売上金額）のリストを返す"""
+    prefix, _ = COMPARISONS[reference]
+    return [f"{prefix}{measure}" for measure in measures]
+
+
+def _aligned_dates(dates, offset):
+    """比較期間の日付を当期の対応日に変換する（ユニーク値ごとに計算）"""
+    unique_dates, inverse = np.unique(dates, return_inverse=True)
+    aligned = (pd.DatetimeIndex(unique_dates) + offset).to_numpy()
+    return aligned[inverse]
+
+
+def compare_periods(rollups, start, end, references=("prev_month",), by=("日付",),
+                    stores=None, departments=None, measures=MEASURE_COLUMNS):
+    """当期と比較期間の集計値を結合して返す
+
+    by の列（"日付"・"店舗名"・"部門名" など）ごとに当期の measures と、
+    references で指定した比較期間の値（列名は「前月売上金額」など）を並べる。
+    行は当期に実績がある組み合わせだけで、比較期間の欠損は0で埋める。
+    by に "日付" を含む場合、比較期間の日付は当期の対応日にそろえる。
+    """
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    by = list(by)
+    measures = list(measures)
+    series = [CURRENT, *references]
+    by_date = "日付" in by
+    # by が空の場合は定数のキーで全体を1行に集計する
+    keys = by or ["_全体"]
+
+    result_columns = by + measures + [
+        column for name in references for column in comparison_columns(name, measures)
+    ]
+    empty = pd.DataFrame(columns=result_columns)
+
+    with span("filter", "集計表") as record:
+        # 当期・比較期間それぞれの集計表の切り出しを1つに連結する
+        parts = []
+        for code, name in enumerate(series):
+            offset = None if name == CURRENT else COMPARISONS[name][1]
+            period_start = start if offset is None else start - offset
+            period_end = end if offset is None else end - offset
+            if by_date:
+                segments = [("daily", period_start, period_end)]
+            else:
+                segments = split_range(period_start, period_end)
+            for grain, first, last in segments:
+                part = slice_period(rollups[grain], first, last)
+                if part.empty:
+                    continue
+                columns = {column: part[column].array for column in by if column != "日付"}
+                if by_date:
+                    dates = part["日付"].to_numpy()
+                    columns["日付"] = dates if offset is None else _aligned_dates(dates, offset)
+                if not by:
+                    columns["_全体"] = np.zeros(len(part), dtype=np.int8)
+                if stores:
+                    columns["店舗名"] = part["店舗名"].array
+                if departments:
+                    columns["部門名"] = part["部門名"].array
+                columns.update({measure: part[measure].to_numpy() for measure in measures})
+                columns["系列"] = np.full(len(part), code, dtype=np.int8)
+                parts.append(pd.DataFrame(columns))
+
+        if not parts:
+            return empty
+
+        rows = pd.concat(parts, ignore_index=True)
+        if stores:
+            rows = rows[rows["店舗名"].isin(stores)]
+        if departments:
+            rows = rows[rows["部門名"].isin(departments)]
+        record["rows"] = len(rows)
+
+    # 1回のgroupbyで全系列を集計し、系列を列方向に展開する
+    wide = (
+        rows.groupby(keys + ["系列"], observed=True, sort=True)[measures]
+        .sum()
+        .unstack("系列")
+    )
+    present = set(wide.columns.get_level_values("系列"))
+    if 0 not in present:
+        return empty
+
+    # 当期に実績がある行だけを残す（左結合）
+    result = wide.xs(0, axis=1, level="系列")[measures]
+    result = result[result.notna().any(axis=1)].copy()
+    for code, name in enumerate(references, start=1):
+        reference_columns = comparison_columns(name, measures)
+        if code in present:
+            values = wide.xs(code, axis=1, level="系列")[measures].loc[result.index]
+            result[reference_columns] = values.to_numpy()
+        else:
+            result[reference_columns] = 0
+
+    result = result.fillna(0).astype("int64").reset_index()
+    return result[result_columns]
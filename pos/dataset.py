@@ -0,0 +1,220 @@
+"""読み込み済みPOSデータの共有
+
+POSデータから作る集計表・店舗/部門一覧を1つのデータセットとしてプロセス内で
+共有する。データファイルが外部で更新された場合は次の呼び出し時に全体を
+読み込み直し、取り込み処理（pos.ingest）で追加された差分は読み込み済みの
+データセットに反映する。
+
+データセットは不変オブジェクトとして扱い、差分の反映時は新しい
+データセットに差し替える。1回の再実行の中では最初に取得したデータセットを
+使い続ければ、途中で取り込みがあっても結果の整合性が保たれる。
+返すDataFrameは全セッションの共有オブジェクトなので変更しないこと。
+期間の集計はすべて集計表（pos.rollup）で行うため、POSデータ（明細）は
+集計表を作った後は保持しない。
+
+環境変数 POS_LOAD_MODE=stream の場合は、POSデータ全体を読み込まずに
+一定行数ずつ逐次集計する（pos.stream）。メモリに載らない大きさのデータでも
+同じ集計表ができる。
+
+作成した集計表は列ファイル（pos.colstore）に保存し、メモリマップで
+読み込み直したものを共有する（環境変数 POS_COLUMN_STORE=0 で無効）。
+データの実体はOSのページキャッシュに1つだけ置かれ、セッション数が増えても
+メモリ使用量は増えない。取り込みで差分を反映したデータセットは、列ファイルへの
+保存（全履歴の書き直し）を別のスレッドで行い、保存が終わるまではメモリ上の
+データセットをそのまま使う。
+
+集計の実行方式がDuckDB（環境変数 POS_QUERY_BACKEND=duckdb、pos.backend）の
+場合は、集計のたびにデータファイルを直接読むため、集計表は作らずに
+マスタと版だけを持つ。
+"""
+import os
+import threading
+
+import streamlit as st
+
+from pos.backend import QUERY_BACKEND
+from pos.colstore import read_column_store, write_column_store
+from pos.loader import get_source_version, read_source
+from pos.master import apply_masters, extend_masters, load_masters
+from pos.rollup import GRAINS, append_rollups, build_rollups
+from pos.stream import stream_rollups
+from pos.trace import span
+
+# 読み込み方式（memory: 全体を読み込む、stream: 逐次集計する）
+LOAD_MODES = ["memory", "stream"]
+LOAD_MODE = os.environ.get("POS_LOAD_MODE", "memory")
+
+if LOAD_MODE not in LOAD_MODES:
+    raise ValueError(f"未対応の読み込み方式です: {LOAD_MODE}（{', '.join(LOAD_MODES)} のいずれか）")
+
+# 列ファイルで共有するかどうか
+COLUMN_STORE = os.environ.get("POS_COLUMN_STORE", "1") == "1"
+
+
+class PosDataset:
+    """POSデータの集計表と店舗/部門一覧
+
+    df にはPOSデータ（rollups を渡す場合は日次集計表）を渡す。集計表を作った後の
+    df 属性は日次集計表（日付×店舗×部門）で、POSデータそのものは保持しない。
+    店舗・部門の列はマスタの並びのカテゴリ型にそろえる（カテゴリのコードが
+    マスタの整数コード）。マスタに未登録の店舗・部門はメモリ上のマスタの
+    末尾に追加する。
+    df にNoneを渡した場合（DuckDB方式）はマスタだけを持ち、df・rollups は
+    None、店舗・部門の一覧はマスタの並びになる。
+    """
+
+    def __init__(self, source, version, df, rollups=None, masters=None, mode="memory"):
+        self.source = source
+        self.version = version
+        self.mode = mode
+        if df is None:
+            self.masters = load_masters() if masters is None else masters
+            self.df = self.rollups = None
+            self.stores = self.masters.stores.names.tolist()
+            self.departments = self.masters.departments.names.tolist()
+            return
+        self.masters = extend_masters(load_masters() if masters is None else masters, df)
+        if rollups is None:
+            rollups = build_rollups(apply_masters(df, self.masters))
+        self.rollups = rollups
+        self.df = rollups["daily"]
+        self.stores = self.df["店舗名"].unique().tolist()
+        self.departments = self.df["部門名"].unique().tolist()
+
+    def tables(self):
+        """列ファイルに保存する表（名前→DataFrame）を返す"""
+        return dict(self.rollups)
+
+    def appended(self, delta, version):
+        """差分を追加した新しいデータセットを返す（自身は変更しない）"""
+        if self.df is None:
+            masters = extend_masters(self.masters, delta)
+            return PosDataset(self.source, version, None, masters=masters)
+        if delta.empty:
+            return PosDataset(
+                self.source, version, self.df, self.rollups, self.masters, self.mode
+            )
+        masters = extend_masters(self.masters, delta)
+        # マスタの並びのカテゴリにそろえれば、連結してもカテゴリ型が保たれる
+        delta = apply_masters(delta, masters)
+        rollups = {grain: apply_masters(rollup, masters) for grain, rollup in self.rollups.items()}
+        rollups = append_rollups(rollups, delta)
+        return PosDataset(self.source, version, rollups["daily"], rollups, masters, self.mode)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_state():
+    return {"dataset": None, "lock": threading.RLock(), "share_lock": threading.Lock()}
+
+
+def _from_tables(source, version, mode, tables, masters):
+    rollups = {grain: tables[grain] for grain in GRAINS}
+    return PosDataset(source, version, rollups["daily"], rollups, masters, mode)
+
+
+def share_dataset(dataset):
+    """データセットを列ファイルに保存し、メモリマップで読み込み直したものを返す
+
+    列ファイルを使わない設定の場合や、集計表を持たない場合（DuckDB方式）、
+    保存できない場合は元のデータセットを返す。
+    """
+    if not COLUMN_STORE or dataset.df is None:
+        return dataset
+    source, version, mode = dataset.source, dataset.version, dataset.mode
+    try:
+        write_column_store(source, version, mode, dataset.tables(), dataset.masters)
+        stored = read_column_store(source, version, mode)
+    except (OSError, ValueError):
+        return dataset
+    return _from_tables(source, version, mode, *stored)
+
+
+def read_dataset(source, version, mode=None, backend=None):
+    """データソースを読み込んでデータセットを作る（保存済みの列ファイルがあれば使う）
+
+    集計の実行方式がDuckDBの場合は、マスタ（データソースに含まれる店舗・部門を
+    追加したもの）だけを読み込む。
+    """
+    if (backend or QUERY_BACKEND) == "duckdb":
+        from pos import duckdb_query
+        with span("load", "マスタ", source=source):
+            masters = duckdb_query.source_masters(source, load_masters())
+        return PosDataset(source, version, None, masters=masters)
+
+    mode = mode or LOAD_MODE
+    with span("load", "データセット", source=source, mode=mode) as record:
+        stored = read_column_store(source, version, mode) if COLUMN_STORE else None
+        if stored is not None:
+            record["column_store"] = True
+            dataset = _from_tables(source, version, mode, *stored)
+        elif mode == "stream":
+            rollups, masters = stream_rollups(source, load_masters())
+            dataset = share_dataset(
+                PosDataset(source, version, rollups["daily"], rollups, masters, mode)
+            )
+        else:
+            dataset = share_dataset(PosDataset(source, version, read_source(source), mode=mode))
+        record["rows"] = len(dataset.df)
+    return dataset
+
+
+def _is_current(dataset, source, version):
+    return dataset is not None and (dataset.source, dataset.version) == (source, version)
+
+
+def get_dataset():
+    """現在のデータセットを返す（データファイルの外部更新時のみ再読み込み）"""
+    state = _get_state()
+    source, version = get_source_version()
+    dataset = state["dataset"]
+    if _is_current(dataset, source, version):
+        return dataset
+
+    with state["lock"]:
+        dataset = state["dataset"]
+        if not _is_current(dataset, source, version):
+            dataset = read_dataset(source, version)
+            state["dataset"] = dataset
+    return dataset
+
+
+def _share_later(dataset):
+    """列ファイルへの保存と差し替えを別のスレッドで行う
+
+    保存は全履歴を書き直すため、データセットのロックの外で行う（保存中も
+    各セッションは保存前のデータセットを使い続け、待たされない）。保存が
+    終わった時点でより新しいデータセットに差し替わっていれば何もしない。
+    """
+    state = _get_state()
+
+    def share():
+        with state["share_lock"]:
+            if state["dataset"] is not dataset:
+                return
+            shared = share_dataset(dataset)
+        with state["lock"]:
+            if state["dataset"] is dataset:
+                state["dataset"] = shared
+
+    if COLUMN_STORE and dataset.df is not None:
+        threading.Thread(target=share, name="pos-colstore", daemon=True).start()
+
+
+def append_to_dataset(delta, persist):
+    """差分を永続化し、読み込み済みのデータセットに反映する
+
+    persist(delta) はデータファイルへの書き込み（と取り込んだファイルの移動）を
+    行う関数。書き込み後のファイルの版を新しいデータセットの版とするため、
+    書き込みによる全体の再読み込みは発生しない。書き込み後の反映に失敗した
+    場合は、次の呼び出しでデータファイルから読み込み直す。
+    列ファイルへの保存は反映後にロックの外で行う（_share_later）。
+    """
+    state = _get_state()
+    with state["lock"]:
+        dataset = get_dataset()
+        persist(delta)
+        _, version = get_source_version()
+        dataset = dataset.appended(delta, version)
+        state["dataset"] = dataset
+    _share_later(dataset)
+    return dataset
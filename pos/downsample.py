@@ -0,0 +1,121 @@
+"""時系列グラフ用の間引き（ダウンサンプリング）
+
+長期間の推移グラフをブラウザへ送る前に、グラフの幅に見合った点数まで
+間引く。形状を保つ方法として次の2つを用意している。
+
+- lttb: Largest-Triangle-Three-Buckets。区間ごとに、前後の点と作る三角形の
+  面積が最大になる点を1つ選ぶ。折れ線の見た目を最もよく保つ。
+- minmax: 区間ごとに最小値と最大値の点を選ぶ。急な山・谷を必ず残す。
+
+複数系列のDataFrameでは点数の上限を系列数で割った点数ずつ系列ごとに選び、
+その和集合を残すため、送信する点数は期間の長さによらず上限以下になる。
+"""
+import os
+
+import numpy as np
+
+# ページ全体の幅（px、layout="wide" の全幅グラフを想定）
+PAGE_WIDTH = int(os.environ.get("POS_CHART_PAGE_WIDTH", "1200"))
+
+# 1pxあたりの点数
+POINTS_PER_PIXEL = float(os.environ.get("POS_CHART_POINTS_PER_PIXEL", "1.0"))
+
+# 点数の下限（これより少ない点数には間引かない）
+MIN_POINTS = 50
+
+
+def chart_point_budget(fraction=1.0, page_width=None, points_per_pixel=None):
+    """グラフを置く領域の幅に見合った点数の上限を返す
+
+    Streamlitのスクリプト側からはブラウザの表示幅を取得できないため、
+    ページ全体の幅（環境変数 POS_CHART_PAGE_WIDTH、既定1200px）に、
+    グラフを置く領域がページ幅に占める割合 fraction（全幅は1.0、st.columns(2) の
+    列の中なら0.5）を掛けた幅を使う。
+    1pxあたりの点数は環境変数 POS_CHART_POINTS_PER_PIXEL（既定1.0）で変更できる。
+    """
+    page_width = PAGE_WIDTH if page_width is None else page_width
+    points_per_pixel = POINTS_PER_PIXEL if points_per_pixel is None else points_per_pixel
+    return max(MIN_POINTS, int(page_width * fraction * points_per_pixel))
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("datetime64[ns]").astype(np.int64)
+    return np.nan_to_num(values.astype(np.float64))
+
+
+def lttb_indices(y, threshold, x=None):
+    """LTTBで残す点の位置（昇順）を返す"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = _as_float(y)
+    x = np.arange(n, dtype=np.float64) if x is None else _as_float(x)
+
+    # 先頭・末尾を除いた点を threshold - 2 個の区間に分ける
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # 次の区間の平均点（最後の区間では末尾の点）
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """区間ごとの最小・最大の点の位置（昇順）を返す"""
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    y = _as_float(y)
+    # 先頭・末尾の2点を加えても threshold 点に収まる区間数にする
+    n_buckets = max(1, (threshold - 2) // 2)
+    buckets = np.arange(n) * n_buckets // n
+
+    # 区間→値の順に並べ、各区間の先頭（最小）と末尾（最大）を選ぶ
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    is_first = np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]]
+    is_last = np.r_[sorted_buckets[1:] != sorted_buckets[:-1], True]
+    selected = np.union1d(order[is_first], order[is_last])
+    # 先頭・末尾の点は常に残す
+    return np.union1d(selected, [0, n - 1])
+
+
+def downsample_frame(df, columns, max_points, x=None, method="lttb"):
+    """DataFrameの行を間引いて返す
+
+    columns の各系列について method で max_points / 系列数 の点を選び、
+    その和集合の行を元の順序で返す。x にはx軸の列名を指定する（未指定時は等間隔とみなす）。
+    行数が max_points 以下の場合はそのまま返す。
+    """
+    if len(df) <= max_points:
+        return df
+    x_values = None if x is None else df[x].to_numpy()
+    per_series = max(3, max_points // len(columns))
+
+    selected = []
+    for column in columns:
+        y = df[column].to_numpy()
+        if method == "lttb":
+            selected.append(lttb_indices(y, per_series, x_values))
+        elif method == "minmax":
+            selected.append(minmax_indices(y, per_series))
+        else:
+            raise ValueError(f"未対応の間引き方法です: {method}")
+    return df.iloc[np.unique(np.concatenate(selected))]
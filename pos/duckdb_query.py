@@ -0,0 +1,274 @@
+"""DuckDBによる集計（pandasの集計表を使わない実行方式）
+
+POSデータファイル（Parquetデータセット・CSV）をDuckDBで直接集計する。
+DuckDBは複数スレッドで実行し、メモリが足りない場合は一時ファイルを使う
+（アウトオブコア）ため、履歴全体をメモリに載せずに集計できる。
+
+期間・店舗・部門の条件はSQLの条件に変換し、Parquetではパーティション
+（年月・店舗ID）と部門コードの条件としてファイル・行グループの読み飛ばしに
+使う。結果の店舗・部門の列はマスタの並びのカテゴリ型（pos.master）に戻し、
+並び順・型とも pos.rollup.aggregate_range・pos.compare.compare_periods と
+同じ結果を返す。
+
+duckdb パッケージは、この方式を使う場合にだけ必要になる（オプションの依存関係
+duckdb。uv sync --extra duckdb でインストールする）。
+"""
+import os
+
+import pandas as pd
+import streamlit as st
+
+from pos.compare import COMPARISONS, comparison_columns
+from pos.master import Masters
+from pos.schema import CSV_COLUMNS, DIMENSION_COLUMNS, MEASURE_COLUMNS
+from pos.storage import DEPARTMENT_CODE, PARQUET_ROOT
+
+# 実行スレッド数（0はDuckDBの既定値＝CPUコア数）
+DUCKDB_THREADS = int(os.environ.get("POS_DUCKDB_THREADS", "0"))
+
+# 使用メモリの上限（例: "2GB"、空はDuckDBの既定値）
+DUCKDB_MEMORY_LIMIT = os.environ.get("POS_DUCKDB_MEMORY_LIMIT", "")
+
+# 上限を超えた分を書き出す一時ディレクトリ
+DUCKDB_TEMP_DIR = os.environ.get("POS_DUCKDB_TEMP_DIR", "data/duckdb_tmp")
+
+# CSVの列の型
+_CSV_TYPES = {
+    **{column: "VARCHAR" for column in DIMENSION_COLUMNS},
+    "日付": "DATE",
+    **{column: "INTEGER" for column in MEASURE_COLUMNS},
+}
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection():
+    """プロセス共有のDuckDB接続（インメモリ）を返す
+
+    問い合わせは cursor() で複製した接続で行う（スレッドごとに独立）。
+    """
+    import duckdb
+
+    config = {"temp_directory": DUCKDB_TEMP_DIR}
+    if DUCKDB_THREADS:
+        config["threads"] = DUCKDB_THREADS
+    if DUCKDB_MEMORY_LIMIT:
+        config["memory_limit"] = DUCKDB_MEMORY_LIMIT
+    return duckdb.connect(":memory:", config=config)
+
+
+def _quote(value):
+    """SQLの文字列リテラルを返す"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _in_list(column, values):
+    """column IN (...) の条件を返す（値がない場合は常に偽）"""
+    values = list(values)
+    if not values:
+        return "FALSE"
+    return f'"{column}" IN ({", ".join(_quote(value) for value in values)})'
+
+
+def _interval(offset):
+    """比較期間のずれ（DateOffset・Timedelta）をSQLのINTERVALに変換する"""
+    if isinstance(offset, pd.Timedelta):
+        return f"INTERVAL {offset.days} DAY"
+    parts = [f"INTERVAL {value} {unit.rstrip('s').upper()}" for unit, value in offset.kwds.items()]
+    return " + ".join(parts)
+
+
+class _Source:
+    """データソース（Parquetデータセット・CSV）ごとのSQLの組み立て"""
+
+    def __init__(self, source, masters):
+        self.masters = masters
+        self.parquet = source == PARQUET_ROOT
+        if self.parquet:
+            pattern = os.path.join(source, "**", "*.parquet")
+            self.relation = (
+                f"read_parquet({_quote(pattern)}, hive_partitioning = true, "
+                "hive_types = {'年月': VARCHAR, '店舗ID': VARCHAR})"
+            )
+            self.department_key = DEPARTMENT_CODE
+        else:
+            types = ", ".join(f"{_quote(column)}: {_CSV_TYPES[column]}" for column in CSV_COLUMNS)
+            self.relation = f"read_csv({_quote(source)}, header = true, columns = {{{types}}})"
+            self.department_key = "部門ID"
+
+    def key(self, column):
+        """集計軸の列に対応するSQLの式（店舗は店舗ID、部門は部門コード・部門ID）"""
+        if column == "日付":
+            return 'CAST("日付" AS DATE)'
+        if column in ("店舗ID", "店舗名"):
+            return '"店舗ID"'
+        if column in ("部門ID", "部門名"):
+            return f'"{self.department_key}"'
+        raise ValueError(f"未対応の集計軸です: {column}")
+
+    def where(self, first, last, stores=None, departments=None):
+        """期間 [first, last] と店舗名・部門名の条件を返す"""
+        first = pd.Timestamp(first).normalize()
+        last = pd.Timestamp(last).normalize()
+        conditions = [
+            f"\"日付\" BETWEEN DATE '{first.date().isoformat()}' "
+            f"AND DATE '{last.date().isoformat()}'"
+        ]
+        if self.parquet:
+            # パーティションの読み飛ばし
+            conditions.append(
+                f"\"年月\" BETWEEN '{first:%Y-%m}' AND '{last:%Y-%m}'"
+            )
+            if stores:
+                conditions.append(_in_list("店舗ID", self.masters.stores.ids_of_names(stores)))
+            if departments:
+                codes = self.masters.departments.codes_of_names(list(departments))
+                codes = codes[codes >= 0].tolist()
+                conditions.append(
+                    f'"{DEPARTMENT_CODE}" IN ({", ".join(map(str, codes))})' if codes else "FALSE"
+                )
+        else:
+            if stores:
+                conditions.append(_in_list("店舗名", stores))
+            if departments:
+                conditions.append(_in_list("部門名", departments))
+        return " AND ".join(conditions)
+
+    def decode(self, frame, by):
+        """SQLの結果（k0, k1, ... の列）を by の列に戻す"""
+        keys = _unique_keys(self, by)
+        columns = {}
+        for column in by:
+            values = frame[f"k{keys.index(self.key(column))}"]
+            if column == "日付":
+                columns[column] = values.astype("datetime64[ns]")
+                continue
+            if column in ("店舗ID", "店舗名"):
+                master = self.masters.stores
+                codes = master.codes_of_ids(values.astype(object))
+            elif self.parquet:
+                master = self.masters.departments
+                codes = values.fillna(-1).to_numpy(dtype="int64")
+            else:
+                master = self.masters.departments
+                codes = master.codes_of_ids(values.astype(object))
+            ids, names = master.decode(codes)
+            columns[column] = ids if column == master.id_column else names
+        return pd.DataFrame(columns, index=frame.index)
+
+
+def _unique_keys(source, by):
+    """集計軸のSQLの式（重複を除く）"""
+    keys = []
+    for column in by:
+        expression = source.key(column)
+        if expression not in keys:
+            keys.append(expression)
+    return keys
+
+
+def _execute(sql):
+    cursor = get_connection().cursor()
+    try:
+        return cursor.execute(sql).df()
+    finally:
+        cursor.close()
+
+
+def source_masters(source, masters):
+    """データソースに含まれる未登録の店舗・部門を追加したマスタを返す
+
+    Parquetデータセットの店舗・部門は書き込み時にマスタへ登録済みなので、
+    CSVの場合だけ店舗・部門の組み合わせをDuckDBで読み込む（全行は読み込まない）。
+    """
+    relation = _Source(source, masters)
+    if relation.parquet:
+        return masters
+    extended = []
+    for master in masters:
+        pairs = _execute(
+            f'SELECT DISTINCT "{master.id_column}", "{master.name_column}" '
+            f"FROM {relation.relation}"
+        )
+        extended.append(master.extended(pairs[master.id_column], pairs[master.name_column]))
+    return Masters(*extended)
+
+
+def _finish(frame, source, by, values):
+    """キーを戻して by の順に並べた結果を返す"""
+    result = pd.concat(
+        [source.decode(frame, by), frame[values].astype("int64")], axis=1
+    )
+    if by:
+        result = result.sort_values(by, kind="stable", ignore_index=True)
+    return result
+
+
+def aggregate_range(dataset, start, end, by=(), stores=None, departments=None):
+    """pos.rollup.aggregate_range と同じ集計をDuckDBで行う
+
+    dataset はデータソース（source）とマスタ（masters）を持つデータセット。
+    """
+    source = _Source(dataset.source, dataset.masters)
+    by = list(by)
+    keys = _unique_keys(source, by)
+    selects = [f"{key} AS k{i}" for i, key in enumerate(keys)]
+    selects += [f'CAST(COALESCE(SUM("{m}"), 0) AS BIGINT) AS "{m}"' for m in MEASURE_COLUMNS]
+    sql = (
+        f"SELECT {', '.join(selects)} FROM {source.relation} "
+        f"WHERE {source.where(start, end, stores, departments)}"
+    )
+    if keys:
+        sql += f" GROUP BY {', '.join(f'k{i}' for i in range(len(keys)))}"
+    return _finish(_execute(sql), source, by, MEASURE_COLUMNS)
+
+
+def compare_periods(dataset, start, end, references=("prev_month",), by=("日付",),
+                    stores=None, departments=None, measures=MEASURE_COLUMNS):
+    """pos.compare.compare_periods と同じ集計をDuckDBで行う
+
+    当期・比較期間の行を1つにまとめ（比較期間の日付は当期の対応日に
+    そろえる）、1回のGROUP BYで系列ごとの値を列に展開する。
+    """
+    source = _Source(dataset.source, dataset.masters)
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    by = list(by)
+    measures = list(measures)
+    keys = _unique_keys(source, by)
+
+    parts = []
+    for code, name in enumerate([None, *references]):
+        offset = None if name is None else COMPARISONS[name][1]
+        first = start if offset is None else start - offset
+        last = end if offset is None else end - offset
+        selects = [f"{code} AS s"]
+        for i, key in enumerate(keys):
+            if offset is not None and key == source.key("日付"):
+                key = f"CAST({key} + {_interval(offset)} AS DATE)"
+            selects.append(f"{key} AS k{i}")
+        selects += [f'"{m}"' for m in measures]
+        parts.append(
+            f"SELECT {', '.join(selects)} FROM {source.relation} "
+            f"WHERE {source.where(first, last, stores, departments)}"
+        )
+
+    reference_columns = [
+        column for name in references for column in comparison_columns(name, measures)
+    ]
+    selects = [f"k{i}" for i in range(len(keys))]
+    selects += [f'CAST(SUM("{m}") FILTER (WHERE s = 0) AS BIGINT) AS "{m}"' for m in measures]
+    for code, name in enumerate(references, start=1):
+        selects += [
+            f'CAST(COALESCE(SUM("{m}") FILTER (WHERE s = {code}), 0) AS BIGINT) AS "{column}"'
+            for m, column in zip(measures, comparison_columns(name, measures))
+        ]
+    sql = f"SELECT {', '.join(selects)} FROM ({' UNION ALL '.join(parts)})"
+    if keys:
+        sql += f" GROUP BY {', '.join(f'k{i}' for i in range(len(keys)))}"
+    # 当期に実績がある行だけを残す
+    sql += " HAVING COUNT(*) FILTER (WHERE s = 0) > 0"
+
+    frame = _execute(sql)
+    if frame.empty:
+        return pd.DataFrame(columns=by + measures + reference_columns)
+    return _finish(frame, source, by, measures + reference_columns)
@@ -0,0 +1,126 @@
+"""時間帯別（時間粒度）のPOSデータ
+
+時間帯別のデータは日次の13倍（10時〜22時台）の行数になるため、日次データとは
+別のParquetデータセット（data/pos_hourly）に保存し、全体をメモリに
+読み込むことはしない。ファイルは日次と同じく年月・店舗IDでパーティション
+分割し、各ファイル内は 日付 → 時 → 部門 の順に並べる（時は int8、店舗・部門は
+辞書エンコード）。そのため1日分の 時×店舗×部門 のブロックが連続して並び、
+日付の条件で行グループ単位に読み飛ばせる。
+
+集計は対象日と前週同曜日の行だけを読み込んで 集計軸×時 の表（キューブ）に
+まとめ、時の昇順の累積和（その時台までの当日累計）も同時に求める。
+キューブは日付ごとに集計キャッシュ（pos.cache）に保持し、全セッションで共有する。
+
+時間帯別データは日次データの各行を時間帯ごとの比重で按分して作る（各時間帯の
+合計は日次の値と一致する）。作成済みの場合、取り込み処理（pos.ingest）で
+追加した日次データは時間帯別データにも追加する。全体は現在の日次データから
+``python -m tools.generate_mock_data --hourly-only`` で作り直せる（日次データ・
+予算のファイルは変更しない）。
+"""
+import numpy as np
+import pandas as pd
+
+from pos.cache import cached_query, make_key
+from pos.schema import HOURS, MEASURE_COLUMNS
+from pos.storage import get_parquet_version, parquet_exists, read_pos_parquet, write_pos_parquet
+
+# 時間帯別データの保存先
+HOURLY_ROOT = "data/pos_hourly"
+
+# 時間帯ごとの比重（ランチタイム 11〜14時は1.5倍、ディナータイム 17〜20時は1.8倍）
+HOUR_WEIGHTS = np.array([
+    1.5 if 11 <= hour <= 14 else 1.8 if 17 <= hour <= 20 else 1.0 for hour in HOURS
+])
+
+
+def hourly_exists(root=HOURLY_ROOT):
+    """時間帯別データが作成済みかどうか"""
+    return parquet_exists(root)
+
+
+def get_hourly_version(root=HOURLY_ROOT):
+    """時間帯別データの版を返す"""
+    return get_parquet_version(root)
+
+
+def split_hourly(daily, rng):
+    """日次の売上データを時間帯別に按分する（各時間帯の合計は日次の値と一致）"""
+    n_hours = len(HOURS)
+    rows = np.repeat(np.arange(len(daily)), n_hours)
+    hourly = daily.drop(columns=MEASURE_COLUMNS).iloc[rows].reset_index(drop=True)
+    hourly.insert(hourly.columns.get_loc("日付") + 1, "時",
+                  np.tile(np.array(HOURS, dtype=np.int8), len(daily)))
+    probabilities = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+    for measure in MEASURE_COLUMNS:
+        totals = np.maximum(daily[measure].to_numpy(), 0)
+        hourly[measure] = rng.multinomial(totals, probabilities).ravel()
+    return hourly
+
+
+def append_hourly(delta, root=HOURLY_ROOT, rng=None):
+    """追加した日次データを時間帯別に按分し、時間帯別データに追加する"""
+    rng = np.random.default_rng() if rng is None else rng
+    write_pos_parquet(split_hourly(delta, rng), root, append=True)
+
+
+def cumulative_columns(measures=MEASURE_COLUMNS):
+    """当日累計の列名（例: 累計売上金額）のリストを返す"""
+    return [f"累計{measure}" for measure in measures]
+
+
+def aggregate_hours(df, by=()):
+    """時間帯別データを 日付×集計軸×時 に集計する"""
+    keys = ["日付", *by, "時"]
+    result = (
+        df[MEASURE_COLUMNS]
+        .astype("int64")
+        .groupby([df[column] for column in keys], observed=True, sort=True)
+        .sum()
+    )
+    return result.reset_index()
+
+
+def _hour_matrix(rows, by, index=None):
+    """1日分の集計を 集計軸×(値, 時) の表にし、当日累計の列を加える"""
+    wide = rows.set_index([*by, "時"])[MEASURE_COLUMNS].unstack("時", fill_value=0)
+    columns = pd.MultiIndex.from_product([MEASURE_COLUMNS, HOURS], names=[None, "時"])
+    wide = wide.reindex(index=index, columns=columns, fill_value=0)
+    # 時の昇順の累積和が当日累計になる
+    values = wide.to_numpy().reshape(len(wide), len(MEASURE_COLUMNS), len(HOURS))
+    cumulative = pd.DataFrame(
+        values.cumsum(axis=2).reshape(len(wide), len(MEASURE_COLUMNS) * len(HOURS)),
+        index=wide.index,
+        columns=pd.MultiIndex.from_product([cumulative_columns(), HOURS], names=[None, "時"]),
+    )
+    return pd.concat([wide, cumulative], axis=1)
+
+
+def hourly_cube(date, by, stores=None, root=HOURLY_ROOT):
+    """指定日の 集計軸×時 の集計値を前週同曜日の値と合わせて返す（キャッシュ付き）
+
+    行は by の集計軸（"店舗名"・"部門名" など、当日に実績がある組み合わせ）、
+    列は (値, 時) の2階層。値は売上金額などの実績、累計売上金額などの当日累計、
+    それらの前週同曜日の値（前週売上金額・前週累計売上金額など）。
+    ある時台の表は cube.xs(hour, axis=1, level="時")、時台ごとの合計は
+    cube["売上金額"].sum() で取り出せるため、時台を切り替えても再集計しない。
+    stores は店舗名のリスト（未指定時は全店舗）。
+    """
+    date = pd.Timestamp(date).normalize()
+    reference = date - pd.Timedelta(days=7)
+    by = list(by)
+    key = make_key("hourly", get_hourly_version(root), date, date, stores, (), by)
+
+    def compute():
+        columns = ["日付", "時", *MEASURE_COLUMNS, *by]
+        if stores:
+            columns.append("店舗名")
+        df = read_pos_parquet(
+            root, stores=stores, dates=[reference, date], columns=list(dict.fromkeys(columns))
+        )
+        rows = aggregate_hours(df, by)
+        current = _hour_matrix(rows[rows["日付"] == date], by)
+        previous = _hour_matrix(rows[rows["日付"] == reference], by, index=current.index)
+        previous = previous.rename(columns=lambda column: f"前週{column}", level=0)
+        return pd.concat([current, previous], axis=1)
+
+    return cached_query(key, compute)
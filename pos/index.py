@@ -0,0 +1,17 @@
+"""日付順の表の範囲検索
+
+日付順に並んだ表（集計表など）からの期間の抽出を、ブールマスクではなく
+二分探索（searchsorted）で求めた位置の行スライスで行う。スライスはコピー
+しないため、抽出コストは全体の行数ではなく抽出する期間の行数に比例する。
+"""
+import pandas as pd
+
+
+def date_bounds(dates, start=None, end=None):
+    """日付順の配列 dates のうち [start, end] に当たる位置の範囲を返す"""
+    lo = 0 if start is None else dates.searchsorted(
+        pd.Timestamp(start).to_datetime64(), side="left")
+    hi = len(dates) if end is None else dates.searchsorted(
+        pd.Timestamp(end).to_datetime64(), side="right")
+    return lo, max(lo, hi)
+
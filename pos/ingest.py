@@ -0,0 +1,184 @@
+"""新着POSデータの差分取り込み
+
+取り込みフォルダ（data/incoming）に置かれたCSVファイル（pos_data.csv と
+同じ列構成、1日分ずつなど任意の単位）を読み込み、データファイルへ追記した
+うえで、読み込み済みのデータセットと集計表に差分だけを反映する。
+取り込み済みのファイルは processed フォルダへ移動する。
+
+夜間バッチなどはファイルを取り込みフォルダへ置くだけでよく、取り込みは
+アプリの再実行時（app.py）に行われる。全履歴の再読み込み・再集計は
+発生しないため、取り込み直後の表示が遅くなることはない。
+
+- 取り込むのは名前が .csv で終わるファイルだけ。書き込み中のファイルを
+  取り込まないよう、書き込み側は別の名前（例: 20250401.csv.tmp）で
+  書き終えてから .csv に名前を変えること
+- 列が足りない・値を読み込めないファイルは quarantine フォルダへ移動し、
+  ログに記録する（ほかのファイルの取り込みは続ける）
+- 取り込んだファイルはデータファイルへの書き込みと同じ手順の中で
+  processed フォルダへ移動する。書き込みに失敗した場合は書き込んだ分を
+  取り消し、ファイルは取り込みフォルダに残す（次の再実行で取り込み直す）
+- 時間帯別データ（pos.hourly）が作成済みの場合は、取り込んだ日次データを
+  時間帯別に按分して追加する。追加に失敗した場合はログに記録する（日次データの
+  取り込みは取り消さない。python -m tools.generate_mock_data --hourly-only で
+  作り直せる）
+"""
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from pos.dataset import append_to_dataset
+from pos.hourly import append_hourly, hourly_exists
+from pos.loader import POS_DATA_PATH, read_pos_csv
+from pos.master import register_masters
+from pos.schema import CSV_COLUMNS, POS_DTYPES
+from pos.storage import PARQUET_ROOT, parquet_exists, write_pos_parquet
+from pos.trace import span
+
+# 取り込みフォルダ
+INCOMING_DIR = "data/incoming"
+
+# 取り込み済みファイルの移動先
+PROCESSED_DIR = os.path.join(INCOMING_DIR, "processed")
+
+# 取り込めなかったファイルの移動先
+QUARANTINE_DIR = os.path.join(INCOMING_DIR, "quarantine")
+
+# 同時に複数のセッションから取り込まないためのロック
+_ingest_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def list_incoming_files(incoming_dir=INCOMING_DIR):
+    """未取り込みのCSVファイルをファイル名順に返す（書き込み中の名前のファイルは除く）"""
+    if not os.path.isdir(incoming_dir):
+        return []
+    return sorted(
+        entry.path
+        for entry in os.scandir(incoming_dir)
+        if entry.is_file() and entry.name.endswith(".csv") and not entry.name.startswith(".")
+    )
+
+
+def read_incoming_csv(path):
+    """取り込むCSVファイルを検証して読み込む（取り込めない場合は ValueError）"""
+    # 型変換の前に列の構成を確かめる
+    header = pd.read_csv(path, nrows=0).columns
+    missing = set(CSV_COLUMNS) - set(header)
+    if missing:
+        raise ValueError(f"列がありません: {', '.join(sorted(missing))}")
+    delta = read_pos_csv(path)
+    if not pd.api.types.is_datetime64_any_dtype(delta["日付"]):
+        raise ValueError("日付として読み込めない値があります")
+    if delta[CSV_COLUMNS].isna().any().any():
+        raise ValueError("値が空の行があります")
+    return delta
+
+
+def move_files(paths, directory):
+    """ファイルを directory へ移動する（同名のファイルは置き換える）"""
+    os.makedirs(directory, exist_ok=True)
+    for path in paths:
+        os.replace(path, os.path.join(directory, os.path.basename(path)))
+
+
+def quarantine_file(path, error, quarantine_dir=QUARANTINE_DIR):
+    """取り込めなかったファイルを隔離フォルダへ移動し、ログに記録する"""
+    logger.warning("取り込めないファイルを %s へ移動します: %s: %s", quarantine_dir, path, error)
+    try:
+        move_files([path], quarantine_dir)
+    except OSError:
+        logger.exception("ファイルを移動できませんでした: %s", path)
+
+
+def append_pos_csv(delta, path=POS_DATA_PATH):
+    """POSデータCSVの末尾に追記する（失敗した場合は追記前の状態に戻す）"""
+    size = os.path.getsize(path)
+    try:
+        # 末尾が改行で終わっていない場合は改行を補う
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        delta[CSV_COLUMNS].to_csv(
+            path, mode="a", header=False, index=False, encoding="utf-8", date_format="%Y-%m-%d"
+        )
+    except BaseException:
+        with open(path, "rb+") as f:
+            f.truncate(size)
+        raise
+
+
+def persist_delta(delta):
+    """差分を現在のデータソース（Parquet優先）に書き込む"""
+    if parquet_exists(PARQUET_ROOT):
+        write_pos_parquet(delta, PARQUET_ROOT, append=True)
+    else:
+        append_pos_csv(delta, POS_DATA_PATH)
+
+
+def ingest_files(paths, processed_dir=PROCESSED_DIR, quarantine_dir=QUARANTINE_DIR):
+    """指定したCSVファイルを取り込み、取り込んだ行数を返す
+
+    取り込めないファイルは quarantine_dir へ移動する。取り込んだファイルは
+    データファイルへの書き込みの直後（データセットへの反映より前）に
+    processed_dir へ移動するため、反映の途中で失敗しても同じファイルを
+    二重に取り込むことはない。
+    """
+    deltas = []
+    ingested = []
+    for path in paths:
+        try:
+            deltas.append(read_incoming_csv(path))
+        except (OSError, ValueError) as e:
+            quarantine_file(path, e, quarantine_dir)
+            continue
+        ingested.append(path)
+    if not deltas:
+        return 0
+
+    delta = pd.concat(deltas, ignore_index=True).astype(POS_DTYPES)
+    # 新しい店舗・部門はマスタの末尾に登録する（既存のコードは変わらない）
+    register_masters(delta)
+
+    def persist(delta):
+        persist_delta(delta)
+        move_files(ingested, processed_dir)
+
+    append_to_dataset(delta, persist)
+
+    if hourly_exists():
+        try:
+            append_hourly(delta)
+        except Exception:
+            logger.exception("取り込んだデータを時間帯別データに追加できませんでした")
+    return len(delta)
+
+
+def ingest_incoming(incoming_dir=INCOMING_DIR, processed_dir=PROCESSED_DIR,
+                    quarantine_dir=QUARANTINE_DIR):
+    """取り込みフォルダの新着ファイルを取り込み、取り込んだ行数を返す
+
+    取り込みに失敗した場合はログに記録して0を返す（画面の表示は止めない）。
+    """
+    # 他のセッションが取り込み中の場合は何もしない
+    if not _ingest_lock.acquire(blocking=False):
+        return 0
+    try:
+        paths = list_incoming_files(incoming_dir)
+        if not paths:
+            return 0
+
+        with span("load", "取り込み", files=len(paths)) as record:
+            total = ingest_files(paths, processed_dir, quarantine_dir)
+            record["rows"] = total
+        return total
+    except Exception:
+        logger.exception("新着ファイルの取り込みに失敗しました")
+        return 0
+    finally:
+        _ingest_lock.release()
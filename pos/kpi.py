@@ -0,0 +1,90 @@
+"""日次KPI（当日・月累計の売上・予算比・前年比・客単価など）
+
+店舗別（または1店舗の部門別）のKPIを、全項目まとめて次の手順で計算する。
+
+1. 月初から対象日までの 集計軸×日付 の実績を、前年・前年同曜日の値と
+   合わせて1回の期間比較（pos.compare）で集計する
+2. 集計軸×日付 の順に並んだ結果に、集計軸ごとの累積和をとって月累計を求め、
+   各集計軸の最後の行（対象日まで）の累計を取り出す
+3. 当日の行・予算（pos.budget）と並べ、比率・単価の列を配列演算で求める
+
+店舗数やKPIの列数が増えても、Pythonのループは増えない。
+"""
+import pandas as pd
+
+from pos.budget import daily_budget
+from pos.compare import comparison_columns, compare_periods
+from pos.schema import MEASURE_COLUMNS
+
+# 比較期間（前年・前年同曜日）
+REFERENCES = ["prev_year", "prev_year_same_weekday"]
+
+# KPIの列（表示順）
+KPI_COLUMNS = [
+    "当日売上", "累計売上", "予算比", "累計予算比",
+    "前年売上", "累計前年売上", "前年比", "累計前年比",
+    "前年同曜日売上", "累計前年同曜日売上", "前年同曜日比", "累計前年同曜日比",
+    "当日客数", "累計客数", "客単価", "累計客単価",
+    "当日商品点数", "累計商品点数", "当日一品単価", "累計一品単価",
+]
+
+
+def _divide(numerator, denominator):
+    """割り算の結果を返す（分母が0の場合は欠損）"""
+    return numerator / denominator.where(denominator != 0)
+
+
+def daily_kpis(rollups, budget, date, by, stores=None, compare=compare_periods):
+    """対象日の 集計軸ごとのKPI（KPI_COLUMNS）を返す
+
+    by は "店舗ID"・"店舗名" や "部門ID"・"部門名" などの集計軸、
+    stores は店舗名のリスト（未指定時は全店舗）。行は月初から対象日までに
+    実績がある組み合わせで、当日の実績がない場合の当日の値は0とする。
+    compare は期間比較の関数で、rollups はその第1引数としてそのまま渡す
+    （pos.backend.compare_periods の場合はデータセットを渡す）。
+    """
+    date = pd.Timestamp(date).normalize()
+    by = list(by)
+    values = MEASURE_COLUMNS + [
+        column for reference in REFERENCES for column in comparison_columns(reference)
+    ]
+    rows = compare(
+        rollups, date.replace(day=1), date, references=REFERENCES,
+        by=by + ["日付"], stores=stores,
+    )
+    if rows.empty:
+        return pd.DataFrame(columns=by + KPI_COLUMNS)
+
+    # 集計軸×日付 の順に並んでいるので、集計軸ごとの累積和が月累計になる
+    keys = [rows[column] for column in by]
+    cumulative = rows[values].groupby(keys, observed=True, sort=False).cumsum()
+    last = rows.groupby(keys, observed=True, sort=False).tail(1).index
+    # 当日・予算の表と同じく set_index(by) のインデックスにそろえる
+    # （集計軸が1つの場合は1階層のMultiIndexではなく通常のインデックスになる）
+    total = cumulative.loc[last].set_axis(rows.loc[last, by].set_index(by).index)
+
+    today = rows[rows["日付"] == date].set_index(by)[values].reindex(total.index, fill_value=0)
+    budgets = daily_budget(budget, date, by, stores).reindex(total.index)
+
+    return pd.DataFrame({
+        "当日売上": today["売上金額"],
+        "累計売上": total["売上金額"],
+        "予算比": _divide(today["売上金額"], budgets["予算金額"]) * 100,
+        "累計予算比": _divide(total["売上金額"], budgets["累計予算金額"]) * 100,
+        "前年売上": today["前年売上金額"],
+        "累計前年売上": total["前年売上金額"],
+        "前年比": _divide(today["売上金額"], today["前年売上金額"]) * 100,
+        "累計前年比": _divide(total["売上金額"], total["前年売上金額"]) * 100,
+        "前年同曜日売上": today["前年同曜日売上金額"],
+        "累計前年同曜日売上": total["前年同曜日売上金額"],
+        "前年同曜日比": _divide(today["売上金額"], today["前年同曜日売上金額"]) * 100,
+        "累計前年同曜日比": _divide(total["売上金額"], total["前年同曜日売上金額"]) * 100,
+        "当日客数": today["客数"],
+        "累計客数": total["客数"],
+        "客単価": _divide(today["売上金額"], today["客数"]),
+        "累計客単価": _divide(total["売上金額"], total["客数"]),
+        "当日商品点数": today["個数"],
+        "累計商品点数": total["個数"],
+        "当日一品単価": _divide(today["売上金額"], today["個数"]),
+        "累計一品単価": _divide(total["売上金額"], total["個数"]),
+    }, index=total.index).reset_index()
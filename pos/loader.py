@@ -0,0 +1,64 @@
+"""POSデータファイルの読み込み
+
+ファイルの読み込みと型変換だけを行う（キャッシュなし）。
+読み込んだデータのプロセス内共有は pos.dataset が担う。
+"""
+import os
+
+import pandas as pd
+
+from pos.schema import POS_DTYPES
+from pos.storage import (
+    PARQUET_ROOT, get_parquet_version, iter_pos_parquet, parquet_exists, read_pos_parquet,
+)
+
+# POSデータファイルのパス
+POS_DATA_PATH = "data/pos_data.csv"
+
+
+def get_data_version(path=POS_DATA_PATH):
+    """データファイルの版（更新時刻とサイズ）を返す"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _parse_dates(df):
+    # ヘッダーだけのファイルでは parse_dates が効かず object 型になるため、
+    # 日付列を明示的に変換して行があるときと同じ型にそろえる
+    df["日付"] = pd.to_datetime(df["日付"])
+    return df
+
+
+def read_pos_csv(path=POS_DATA_PATH):
+    """CSVを読み込み、型を固定したDataFrameを返す"""
+    df = _parse_dates(pd.read_csv(path, dtype=POS_DTYPES, parse_dates=["日付"]))
+    # 日付順に並べておく（同一日付内は元の順序を維持）
+    df = df.sort_values("日付", kind="stable", ignore_index=True)
+    return df
+
+
+def get_source_version():
+    """現在のデータソース（Parquetデータセット優先）とその版を返す"""
+    if parquet_exists(PARQUET_ROOT):
+        return PARQUET_ROOT, get_parquet_version(PARQUET_ROOT)
+    return POS_DATA_PATH, get_data_version(POS_DATA_PATH)
+
+
+def read_source(source, columns=None):
+    """データソースの全期間を読み込む"""
+    if source == PARQUET_ROOT:
+        return read_pos_parquet(source, columns=columns)
+    df = read_pos_csv(source)
+    return df if columns is None else df[list(columns)]
+
+
+def iter_source(source, chunk_rows, columns=None):
+    """データソースの全期間を最大 chunk_rows 行ずつ順に返す（行の順序は保証しない）"""
+    if source == PARQUET_ROOT:
+        yield from iter_pos_parquet(source, columns=columns, batch_rows=chunk_rows)
+        return
+    usecols = None if columns is None else list(columns)
+    with pd.read_csv(source, dtype=POS_DTYPES, parse_dates=["日付"], usecols=usecols,
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _parse_dates(chunk) if "日付" in chunk.columns else chunk
@@ -0,0 +1,229 @@
+"""店舗・部門マスタ
+
+店舗・部門のID・名称と整数コードを一元管理する。整数コードはマスタ内の
+位置（0始まり）で、マスタファイル（data/stores.csv・data/departments.csv）は
+行の追加だけを行い既存の行の順序は変えないため、コードは変わらない。
+
+POSデータのディメンション列（店舗ID・店舗名・部門ID・部門名）は、マスタの
+並びをカテゴリとするカテゴリ型で保持する（apply_masters）。カテゴリの
+コードがそのままマスタの整数コードになるため、どのDataFrameでも同じ店舗・
+部門は同じコードを持ち、集計・結合はコード（整数）で行われる。
+ID・名称の検索は辞書で行う（店舗数によらず一定時間）。
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# マスタファイルのパス
+STORE_MASTER_PATH = "data/stores.csv"
+DEPARTMENT_MASTER_PATH = "data/departments.csv"
+
+# 店舗マスタの既定値
+DEFAULT_STORES = {
+    "S001": "東京本店",
+    "S002": "大阪支店",
+    "S003": "名古屋支店",
+    "S004": "福岡支店",
+    "S005": "札幌支店",
+}
+
+# 部門マスタの既定値（全店舗共通）
+DEFAULT_DEPARTMENTS = {
+    "D001": "食品",
+    "D002": "飲料",
+    "D003": "菓子",
+    "D004": "日用品",
+    "D005": "衣類",
+    "D006": "化粧品",
+    "D007": "文具",
+    "D008": "家電",
+    "D009": "玩具",
+    "D010": "雑貨",
+}
+
+
+class Master:
+    """IDと名称の対応表（整数コードはIDの位置）"""
+
+    def __init__(self, ids, names, id_column, name_column):
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.id_column = id_column
+        self.name_column = name_column
+        self.id_dtype = pd.CategoricalDtype(self.ids)
+        self.name_dtype = pd.CategoricalDtype(self.names)
+        self._code_of_id = {value: code for code, value in enumerate(self.ids)}
+        self._code_of_name = {value: code for code, value in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, value):
+        return value in self._code_of_id
+
+    def name(self, value):
+        """IDに対応する名称を返す"""
+        return self.names[self._code_of_id[value]]
+
+    def label(self, value):
+        """表示用の名称を返す（未登録の値はそのまま返す、selectbox の format_func 用）"""
+        code = self._code_of_id.get(value)
+        return value if code is None else self.names[code]
+
+    def id_of(self, name):
+        """名称に対応するIDを返す"""
+        return self.ids[self._code_of_name[name]]
+
+    def codes_of_ids(self, values):
+        """IDの配列を整数コードの配列に変換する（未登録のIDは-1）"""
+        return pd.Categorical(values, dtype=self.id_dtype).codes
+
+    def codes_of_names(self, names):
+        """名称の配列を整数コードの配列に変換する（未登録の名称は-1）"""
+        return pd.Categorical(names, dtype=self.name_dtype).codes
+
+    def decode(self, codes):
+        """整数コードの配列を (ID, 名称) のカテゴリ配列に変換する"""
+        codes = np.asarray(codes)
+        return (
+            pd.Categorical.from_codes(codes, dtype=self.id_dtype),
+            pd.Categorical.from_codes(codes, dtype=self.name_dtype),
+        )
+
+    def take(self, codes):
+        """指定したコードの行だけのマスタを返す（コードは振り直される）"""
+        return Master(self.ids[codes], self.names[codes], self.id_column, self.name_column)
+
+    def ids_of_names(self, names):
+        """名称のリストを登録済みのIDのリストに変換する（未登録の名称は除く）"""
+        codes = self.codes_of_names(list(names))
+        return self.ids[codes[codes >= 0]].tolist()
+
+    def extended(self, ids, names):
+        """未登録のIDを末尾に追加したマスタを返す（既存のコードは変わらない）"""
+        ids = pd.Series(ids)
+        # カテゴリ型ならカテゴリだけを見れば済む（行数によらない）
+        unique = ids.cat.categories if isinstance(ids.dtype, pd.CategoricalDtype) else ids.unique()
+        if all(value in self._code_of_id for value in unique):
+            return self
+        pairs = pd.DataFrame({"id": ids.to_numpy(dtype=object),
+                              "name": np.asarray(names, dtype=object)}).drop_duplicates("id")
+        pairs = pairs[~pairs["id"].isin(self.ids)].sort_values("id")
+        return Master(
+            np.concatenate([self.ids, pairs["id"].to_numpy()]),
+            np.concatenate([self.names, pairs["name"].to_numpy()]),
+            self.id_column,
+            self.name_column,
+        )
+
+    def to_frame(self):
+        return pd.DataFrame({self.id_column: self.ids, self.name_column: self.names})
+
+
+Masters = namedtuple("Masters", ["stores", "departments"])
+
+
+def store_master(items=()):
+    """{店舗ID: 店舗名} から店舗マスタを作る"""
+    items = dict(items)
+    return Master(list(items), list(items.values()), "店舗ID", "店舗名")
+
+
+def department_master(items=()):
+    """{部門ID: 部門名} から部門マスタを作る"""
+    items = dict(items)
+    return Master(list(items), list(items.values()), "部門ID", "部門名")
+
+
+def build_masters(n_stores=None, n_departments=None):
+    """既定のマスタを指定数にそろえて返す
+
+    既定のマスタより多い数を指定した場合は、連番のIDと名称を追加する。
+    """
+    n_stores = len(DEFAULT_STORES) if n_stores is None else n_stores
+    n_departments = len(DEFAULT_DEPARTMENTS) if n_departments is None else n_departments
+    stores = dict(list(DEFAULT_STORES.items())[:n_stores])
+    for i in range(len(stores), n_stores):
+        stores[f"S{i + 1:03d}"] = f"店舗{i + 1:03d}"
+    departments = dict(list(DEFAULT_DEPARTMENTS.items())[:n_departments])
+    for i in range(len(departments), n_departments):
+        departments[f"D{i + 1:03d}"] = f"部門{i + 1:03d}"
+    return Masters(store_master(stores), department_master(departments))
+
+
+def get_masters_version(store_path=STORE_MASTER_PATH, department_path=DEPARTMENT_MASTER_PATH):
+    """マスタファイルの版を返す（ファイルがない場合はNone）"""
+    if not (os.path.exists(store_path) and os.path.exists(department_path)):
+        return None
+    stats = [os.stat(path) for path in (store_path, department_path)]
+    return "-".join(f"{stat.st_mtime_ns}-{stat.st_size}" for stat in stats)
+
+
+def read_masters(store_path=STORE_MASTER_PATH, department_path=DEPARTMENT_MASTER_PATH):
+    """マスタファイルを読み込む（ファイルがない場合は空のマスタ）"""
+    if get_masters_version(store_path, department_path) is None:
+        return Masters(store_master(), department_master())
+    stores = pd.read_csv(store_path, dtype=str)
+    departments = pd.read_csv(department_path, dtype=str)
+    return Masters(
+        Master(stores["店舗ID"], stores["店舗名"], "店舗ID", "店舗名"),
+        Master(departments["部門ID"], departments["部門名"], "部門ID", "部門名"),
+    )
+
+
+def write_masters(masters, store_path=STORE_MASTER_PATH, department_path=DEPARTMENT_MASTER_PATH):
+    """マスタファイルを書き込む"""
+    for master, path in ((masters.stores, store_path), (masters.departments, department_path)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        master.to_frame().to_csv(path, index=False, encoding="utf-8")
+
+
+@st.cache_resource(show_spinner=False)
+def _load_masters(version):
+    return read_masters()
+
+
+def load_masters():
+    """マスタを返す（ファイルの更新時のみ読み込み直す）"""
+    return _load_masters(get_masters_version())
+
+
+def extend_masters(masters, df):
+    """df に含まれる未登録の店舗・部門を追加したマスタを返す"""
+    return Masters(
+        masters.stores.extended(df["店舗ID"], df["店舗名"]),
+        masters.departments.extended(df["部門ID"], df["部門名"]),
+    )
+
+
+def register_masters(df):
+    """df に含まれる未登録の店舗・部門をマスタファイルに追加し、マスタを返す"""
+    masters = read_masters()
+    extended = extend_masters(masters, df)
+    if extended != masters:
+        write_masters(extended)
+    return extended
+
+
+def apply_masters(df, masters):
+    """ディメンション列をマスタの並びのカテゴリ型にそろえたDataFrameを返す
+
+    マスタに未登録の店舗・部門がある場合は、先に extend_masters でマスタに
+    追加しておくこと（未登録の値は欠損になる）。
+    """
+    df = df.copy(deep=False)
+    for master in masters:
+        for column, dtype in ((master.id_column, master.id_dtype),
+                              (master.name_column, master.name_dtype)):
+            if column not in df:
+                continue
+            values = df[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                df[column] = values.astype(dtype)
+            elif not values.cat.categories.equals(dtype.categories):
+                # 順序だけが違うカテゴリ型は astype では並べ替えられない
+                df[column] = values.cat.set_categories(dtype.categories)
+    return df
@@ -0,0 +1,153 @@
+"""日付×店舗×部門のロールアップ（事前集計）
+
+データの読み込み時に次の集計表を一度だけ作成し、全セッションで共有する
+（pos.dataset）。新しいデータの追加時は差分だけを集計表に反映する。
+
+- daily: 日付×店舗×部門の日次集計表
+- weekly: 週の開始日（月曜）×店舗×部門の週次集計表
+- monthly: 月の開始日×店舗×部門の月次集計表
+
+期間集計は指定期間を「月全体」「週全体」「端数の日」に分解し、
+それぞれ最も粗い集計表から必要な行だけを切り出して合算する。
+そのため集計コストは履歴の長さではなく、出力するセル数に比例する。
+
+各集計表は期間の開始日（日付列）順に並んでおり、週は月曜始まり。
+"""
+import pandas as pd
+
+from pos.index import date_bounds
+from pos.schema import DIMENSION_COLUMNS, MEASURE_COLUMNS, align_categories
+from pos.trace import span
+
+# 集計の粒度（細かい順）
+GRAINS = ["daily", "weekly", "monthly"]
+
+
+def period_start(dates, grain):
+    """日付を各粒度の期間開始日に変換する"""
+    if grain == "daily":
+        return dates
+    if grain == "weekly":
+        return dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+    if grain == "monthly":
+        return dates.dt.to_period("M").dt.start_time
+    raise ValueError(f"未対応の粒度です: {grain}")
+
+
+def build_rollup(df, grain):
+    """POSデータを指定粒度で日付×店舗×部門に集計する"""
+    keys = {"日付": period_start(df["日付"], grain)}
+    keys.update({column: df[column] for column in DIMENSION_COLUMNS})
+    rollup = (
+        df[MEASURE_COLUMNS]
+        .astype("int64")
+        .groupby(list(keys.values()), observed=True, sort=True)
+        .sum()
+    )
+    rollup.index.names = list(keys)
+    return rollup.reset_index()
+
+
+def build_rollups(df):
+    """全粒度の集計表を作成する"""
+    return {grain: build_rollup(df, grain) for grain in GRAINS}
+
+
+def append_rollups(rollups, delta):
+    """集計表に追加分のPOSデータを反映した新しい集計表を返す
+
+    追加分の最も古い期間以降の行だけを再集計するため、通常の日次追加では
+    末尾の数行の再集計で済む。元の集計表は変更しない。
+    """
+    result = {}
+    for grain in GRAINS:
+        rollup, delta_rollup = align_categories(rollups[grain], build_rollup(delta, grain))
+        if delta_rollup.empty:
+            result[grain] = rollup
+            continue
+        lo, _ = date_bounds(rollup["日付"].to_numpy(), start=delta_rollup["日付"].iloc[0])
+        tail = (
+            pd.concat([rollup.iloc[lo:], delta_rollup], ignore_index=True)
+            .groupby(["日付", *DIMENSION_COLUMNS], observed=True, sort=True)[MEASURE_COLUMNS]
+            .sum()
+            .reset_index()
+        )
+        result[grain] = pd.concat([rollup.iloc[:lo], tail], ignore_index=True)
+    return result
+
+
+def split_range(start, end):
+    """期間を (粒度, 先頭の期間開始日, 末尾の期間開始日) の区間に分解する
+
+    区間の順序は不定（合算するだけなので順序は問わない）。
+    """
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    if start > end:
+        return []
+
+    # 期間内に完全に含まれる月
+    first_month = start if start.day == 1 else start + pd.offsets.MonthBegin(1)
+    last_month_end = end if end.is_month_end else end - pd.offsets.MonthEnd(1)
+    if first_month <= last_month_end:
+        middle = [("monthly", first_month, last_month_end.replace(day=1))]
+        edges = [(start, first_month - pd.Timedelta(days=1)),
+                 (last_month_end + pd.Timedelta(days=1), end)]
+    else:
+        middle = []
+        edges = [(start, end)]
+
+    segments = middle
+    for edge_start, edge_end in edges:
+        if edge_start > edge_end:
+            continue
+        # 端数部分に完全に含まれる週
+        first_week = edge_start + pd.Timedelta(days=(7 - edge_start.weekday()) % 7)
+        last_week_end = edge_end - pd.Timedelta(days=(edge_end.weekday() + 1) % 7)
+        if first_week <= last_week_end:
+            parts = [
+                ("daily", edge_start, first_week - pd.Timedelta(days=1)),
+                ("weekly", first_week, last_week_end - pd.Timedelta(days=6)),
+                ("daily", last_week_end + pd.Timedelta(days=1), edge_end),
+            ]
+        else:
+            parts = [("daily", edge_start, edge_end)]
+        segments.extend(part for part in parts if part[1] <= part[2])
+    return segments
+
+
+def slice_period(rollup, first, last):
+    """期間開始日が [first, last] の行を切り出す（集計表は日付順）"""
+    lo, hi = date_bounds(rollup["日付"].to_numpy(), first, last)
+    return rollup.iloc[lo:hi]
+
+
+def aggregate_range(rollups, start, end, by=(), stores=None, departments=None):
+    """期間内の売上金額・客数・個数を by の列ごとに合計する
+
+    rollups は build_rollups の戻り値（通常は pos.dataset.get_dataset().rollups）。
+    by には "日付"・"店舗名"・"部門名" などを指定する。"日付" を含む場合は
+    日次の集計表を、含まない場合は期間を分解して粗い集計表を使う。
+    stores・departments は店舗名・部門名のリスト（未指定時は全件）。
+    """
+    by = list(by)
+
+    if "日付" in by:
+        segments = [("daily", pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())]
+    else:
+        segments = split_range(start, end)
+
+    with span("filter", "集計表") as record:
+        parts = [slice_period(rollups[grain], first, last) for grain, first, last in segments]
+        parts = [part for part in parts if not part.empty] or [rollups["daily"].iloc[0:0]]
+        rows = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+        if stores:
+            rows = rows[rows["店舗名"].isin(stores)]
+        if departments:
+            rows = rows[rows["部門名"].isin(departments)]
+        record["rows"] = len(rows)
+
+    if not by:
+        return rows[MEASURE_COLUMNS].sum().to_frame().T
+    return rows.groupby(by, observed=True, sort=True)[MEASURE_COLUMNS].sum().reset_index()
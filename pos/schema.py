@@ -0,0 +1,42 @@
+"""POSデータの列定義"""
+import pandas as pd
+
+# ディメンション列（カテゴリ型で保持）
+DIMENSION_COLUMNS = ["店舗ID", "店舗名", "部門ID", "部門名"]
+
+# 集計対象の数値列（int32で保持、集計時はint64に拡張される）
+MEASURE_COLUMNS = ["売上金額", "客数", "個数"]
+
+# 時間帯別データの時（営業時間 10時〜22時台）
+HOURS = list(range(10, 23))
+
+# CSVファイルの列順
+CSV_COLUMNS = ["店舗ID", "店舗名", "部門ID", "部門名", "日付", *MEASURE_COLUMNS]
+
+# 読み込み時の型定義
+POS_DTYPES = {
+    **{column: "category" for column in DIMENSION_COLUMNS},
+    **{column: "int32" for column in MEASURE_COLUMNS},
+}
+
+
+def align_categories(*frames):
+    """ディメンション列のカテゴリを全DataFrameでそろえる
+
+    連結（pd.concat）したときにカテゴリ型が保たれるよう、各列のカテゴリを
+    出現順の和集合に置き換えたDataFrameのリストを返す。
+    """
+    frames = list(frames)
+    for column in DIMENSION_COLUMNS:
+        if not all(column in frame.columns for frame in frames):
+            continue
+        categories = pd.Index([])
+        for frame in frames:
+            categories = categories.append(
+                pd.Index(frame[column].cat.categories).difference(categories, sort=False))
+        for i, frame in enumerate(frames):
+            if not frame[column].cat.categories.equals(categories):
+                frame = frame.copy(deep=False)
+                frame[column] = frame[column].cat.set_categories(categories)
+                frames[i] = frame
+    return frames
@@ -0,0 +1,262 @@
+"""POSデータの列指向ストレージ（Parquet）
+
+年月・店舗ID単位でパーティション分割したParquetデータセットとして保存する。
+店舗名・部門ID・部門名の文字列は保存せず、部門は部門マスタの整数コード
+（部門コード、int16）で保存し、読み込み時にマスタ（pos.master）で戻す。
+読み込み時は期間・店舗・部門の条件をパーティションと行グループの統計情報に
+押し下げ、必要なファイル・行グループ・列だけを読む。
+
+ディレクトリ構成::
+
+    data/pos_parquet/
+        _version
+        年月=2025-01/店舗ID=S001/part-0.parquet
+        ...
+
+pyarrow.dataset・pyarrow.parquet は Parquetを読み書きする関数の中で読み込む
+（CSVのデータだけを使う場合は読み込まない）。pyarrow 本体は pandas の読み込み時に
+読み込まれるため、先頭で読み込む。
+"""
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from pos.master import load_masters, register_masters
+from pos.schema import DIMENSION_COLUMNS, MEASURE_COLUMNS
+from pos.trace import span
+
+# Parquetデータセットの保存先
+PARQUET_ROOT = "data/pos_parquet"
+
+# 書き込みのたびに更新する版管理ファイル
+VERSION_FILE = "_version"
+
+# パーティションキー
+PARTITION_COLUMNS = ["年月", "店舗ID"]
+
+# 部門の整数コードの列名
+DEPARTMENT_CODE = "部門コード"
+
+# 1行グループあたりの最大行数
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def _partitioning():
+    """年月・店舗IDのHive形式のパーティション"""
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(
+        pa.schema([("年月", pa.string()), ("店舗ID", pa.string())]),
+        flavor="hive",
+    )
+
+
+def parquet_exists(root=PARQUET_ROOT):
+    """Parquetデータセットが作成済みかどうか"""
+    return os.path.exists(os.path.join(root, VERSION_FILE))
+
+
+def get_parquet_version(root=PARQUET_ROOT):
+    """データセットの版（版管理ファイルの更新時刻とサイズ）を返す"""
+    stat = os.stat(os.path.join(root, VERSION_FILE))
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def partition_dir(root, month, store_id):
+    """年月（YYYY-MM）・店舗IDのパーティションのディレクトリを返す"""
+    return os.path.join(root, f"年月={month}", f"店舗ID={store_id}")
+
+
+def update_version(root=PARQUET_ROOT):
+    """版管理ファイルを更新する（読み込み側のキャッシュ無効化に使う）"""
+    with open(os.path.join(root, VERSION_FILE), "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+
+
+def _prepare(df, masters):
+    """書き込み用に部門を整数コードに置き換え、型と並び順をそろえる
+
+    どの経路で書いても同じスキーマ（店舗ID・日付・[時]・部門コード・数値列）になる。
+    """
+    codes = masters.departments.codes_of_ids(df["部門ID"])
+    if (codes < 0).any():
+        raise ValueError("部門マスタに登録されていない部門IDがあります")
+    columns = {"店舗ID": df["店舗ID"].astype(str).to_numpy()}
+    columns["日付"] = pd.to_datetime(df["日付"]).to_numpy()
+    if "時" in df:
+        columns["時"] = df["時"].to_numpy(dtype=np.int8)
+    columns[DEPARTMENT_CODE] = codes.astype(np.int16)
+    columns.update({column: df[column].to_numpy(dtype=np.int32) for column in MEASURE_COLUMNS})
+    order = [column for column in ("日付", "時", DEPARTMENT_CODE) if column in columns]
+    return pd.DataFrame(columns).sort_values(order, kind="stable", ignore_index=True)
+
+
+def write_pos_parquet(df, root=PARQUET_ROOT, append=False):
+    """POSデータをパーティション分割してParquetに書き込む
+
+    書き込み対象の年月・店舗のパーティションは置き換えられ、それ以外の
+    パーティションはそのまま残る。append=True の場合は既存のファイルを
+    残したまま、パーティションに新しいファイルを追加する（書き込みに失敗した
+    場合は追加したファイルを削除する）。
+    """
+    import pyarrow.dataset as ds
+
+    df = _prepare(df, register_masters(df))
+    df["年月"] = df["日付"].dt.strftime("%Y-%m")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    prefix = f"part-{time.time_ns()}-" if append else "part-"
+    try:
+        ds.write_dataset(
+            table,
+            root,
+            format="parquet",
+            partitioning=_partitioning(),
+            basename_template=f"{prefix}{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore" if append else "delete_matching",
+            max_rows_per_group=ROW_GROUP_SIZE,
+        )
+    except BaseException:
+        if append:
+            for path in glob.glob(os.path.join(root, "*", "*", f"{prefix}*.parquet")):
+                os.remove(path)
+        raise
+    update_version(root)
+
+
+def write_pos_partition(df, root, month, store_id, masters):
+    """1つの年月・店舗分のPOSデータをパーティションのファイルとして書き込む
+
+    部門は masters の部門マスタでコードに変換する（マスタファイルは事前に
+    書き込んでおくこと）。版管理ファイルは更新しないため、全パーティションの
+    書き込み後に update_version を呼ぶこと。書き込んだファイルのパスを返す。
+    """
+    import pyarrow.parquet as pq
+
+    df = _prepare(df, masters).drop(columns=["店舗ID"])
+    directory = partition_dir(root, month, store_id)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part-0.parquet")
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=ROW_GROUP_SIZE
+    )
+    return path
+
+
+def build_filter(start=None, end=None, stores=None, departments=None, dates=None,
+                 masters=None):
+    """抽出条件をpyarrowのフィルタ式に変換する
+
+    店舗名・部門名の条件は、マスタで店舗ID（パーティションキー）・部門コードの
+    条件に変換する。dates を指定した場合は、期間に加えてその日付（のリスト）
+    だけに絞り込む。
+    """
+    import pyarrow.dataset as ds
+
+    masters = load_masters() if masters is None else masters
+    conditions = []
+    if dates is not None:
+        dates = pd.DatetimeIndex(dates)
+        conditions.append(ds.field("年月").isin(dates.strftime("%Y-%m").unique().tolist()))
+        conditions.append(ds.field("日付").isin(dates.tolist()))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(ds.field("年月") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("日付") >= start)
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(ds.field("年月") <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("日付") <= end)
+    if stores:
+        conditions.append(ds.field("店舗ID").isin(masters.stores.ids_of_names(stores)))
+    if departments:
+        codes = masters.departments.codes_of_names(list(departments))
+        conditions.append(ds.field(DEPARTMENT_CODE).isin(codes[codes >= 0].tolist()))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _physical_columns(columns):
+    """論理的な列を読み込むParquetの列に変換する
+
+    店舗・部門の列は店舗ID・部門コードから復元する。
+    """
+    physical = [column for column in columns if column not in DIMENSION_COLUMNS]
+    if {"店舗ID", "店舗名"} & set(columns):
+        physical.append("店舗ID")
+    if {"部門ID", "部門名"} & set(columns):
+        physical.append(DEPARTMENT_CODE)
+    return physical
+
+
+def _decode(df, columns, masters):
+    """読み込んだParquetの列を論理的な列に戻す"""
+    decoded = {}
+    if "店舗ID" in df:
+        decoded["店舗ID"], decoded["店舗名"] = masters.stores.decode(
+            masters.stores.codes_of_ids(df["店舗ID"]))
+    if DEPARTMENT_CODE in df:
+        decoded["部門ID"], decoded["部門名"] = masters.departments.decode(df[DEPARTMENT_CODE])
+    return pd.DataFrame({
+        column: decoded[column] if column in decoded
+        else df[column].astype("int32") if column in MEASURE_COLUMNS
+        else df[column]
+        for column in columns
+    })
+
+
+def _default_columns(dataset):
+    columns = ["日付", *DIMENSION_COLUMNS, *MEASURE_COLUMNS]
+    if "時" in dataset.schema.names:
+        columns.insert(1, "時")
+    return columns
+
+
+def read_pos_parquet(root=PARQUET_ROOT, start=None, end=None, stores=None,
+                     departments=None, columns=None, dates=None):
+    """条件に合うPOSデータだけをParquetから読み込む
+
+    stores・departmentsは店舗名・部門名のリストで、未指定時は全件が対象。
+    datesを指定した場合はその日付の行だけを読み込む。
+    columnsを指定した場合はその列だけを読み込む。店舗・部門の列は
+    マスタの並びのカテゴリ型（pos.master.apply_masters と同じ型）で返す。
+    """
+    import pyarrow.dataset as ds
+
+    with span("load", "Parquet") as record:
+        masters = load_masters()
+        dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+        columns = _default_columns(dataset) if columns is None else list(columns)
+
+        table = dataset.to_table(
+            columns=_physical_columns(columns),
+            filter=build_filter(start, end, stores, departments, dates, masters),
+        )
+        result = _decode(table.to_pandas(), columns, masters)
+        if "日付" in result.columns:
+            result = result.sort_values("日付", kind="stable", ignore_index=True)
+        record["rows"] = len(result)
+    return result
+
+
+def iter_pos_parquet(root=PARQUET_ROOT, columns=None, batch_rows=ROW_GROUP_SIZE):
+    """ParquetのPOSデータを最大 batch_rows 行ずつのDataFrameとして順に返す
+
+    全体をメモリに載せずに読み込む場合に使う（行の順序は保証しない）。
+    列の型は read_pos_parquet と同じ。
+    """
+    import pyarrow.dataset as ds
+
+    masters = load_masters()
+    dataset = ds.dataset(root, format="parquet", partitioning=_partitioning())
+    columns = _default_columns(dataset) if columns is None else list(columns)
+    for batch in dataset.to_batches(columns=_physical_columns(columns), batch_size=batch_rows):
+        if batch.num_rows:
+            yield _decode(batch.to_pandas(), columns, masters)
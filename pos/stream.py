@@ -0,0 +1,108 @@
+"""POSデータの逐次集計（メモリに載らない大きさのデータ向け）
+
+POSデータファイルを一定行数ずつ読み込み、読み込んだ分を日付×店舗×部門の
+日次集計表に合算していく。全行を同時にメモリに置かないため、必要な
+メモリは「読み込む行数＋集計表の大きさ」で決まり、ファイルの大きさには
+よらない。集計表からは pos.rollup の全粒度の集計表を作るため、
+KPI・推移・クロス集計はすべて同じ集計処理でそのまま使える。
+
+1回に読み込む行数は環境変数 POS_STREAM_CHUNK_ROWS で変更できる。
+"""
+import os
+
+import pandas as pd
+
+from pos.loader import iter_source
+from pos.master import apply_masters, extend_masters
+from pos.rollup import build_rollup
+from pos.schema import DIMENSION_COLUMNS, MEASURE_COLUMNS
+
+# 1回に読み込む行数
+CHUNK_ROWS = int(os.environ.get("POS_STREAM_CHUNK_ROWS", "1000000"))
+
+# 集計に使う列
+STREAM_COLUMNS = ["日付", *DIMENSION_COLUMNS, *MEASURE_COLUMNS]
+
+
+def _fold(frames, masters):
+    """日次集計表のリストを1つの日次集計表に合算する"""
+    frames = [apply_masters(frame, masters) for frame in frames]
+    rows = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return (
+        rows.groupby(["日付", *DIMENSION_COLUMNS], observed=True, sort=True)[MEASURE_COLUMNS]
+        .sum()
+        .reset_index()
+    )
+
+
+def _concat(chunks, masters):
+    chunks = [apply_masters(chunk, masters) for chunk in chunks]
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+
+def _batches(chunks, masters, chunk_rows):
+    """チャンクを chunk_rows 行以上ずつにまとめ、(マスタ, まとめたチャンク) を順に返す
+
+    Parquetのファイル・行グループ単位の小さなチャンクを、集計1回あたりの
+    行数がそろうようにまとめる。マスタにはチャンク中の未登録の店舗・部門を追加する。
+    """
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        masters = extend_masters(masters, chunk)
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= chunk_rows:
+            yield masters, _concat(buffer, masters)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield masters, _concat(buffer, masters)
+
+
+def stream_daily_rollup(chunks, masters, chunk_rows=CHUNK_ROWS):
+    """POSデータのチャンクを順に日次集計表へ合算する
+
+    chunks はPOSデータのDataFrameを順に返すイテラブル。chunk_rows 行ずつ
+    集計し、集計結果は集計表と同じ行数（最低 chunk_rows 行）までためてから
+    集計表に合算する（合算の回数を抑え、使用メモリは集計表の数倍までにする）。
+    (日次集計表, チャンク中の未登録の店舗・部門を追加したマスタ) を返す。
+    結果は pos.rollup.build_rollup(全データ, "daily") と同じ。
+    """
+    running = None
+    pending = []
+    pending_rows = 0
+    for batch_masters, batch in _batches(chunks, masters, chunk_rows):
+        masters = batch_masters
+        partial = build_rollup(batch, "daily")
+        del batch
+        pending.append(partial)
+        pending_rows += len(partial)
+        if pending_rows >= max(chunk_rows, 0 if running is None else len(running)):
+            running = _fold(pending if running is None else [running, *pending], masters)
+            pending = []
+            pending_rows = 0
+
+    if running is not None and not pending:
+        return running, masters
+    frames = pending if running is None else [running, *pending]
+    if not frames:
+        # データがない場合は空の集計表
+        frames = [pd.DataFrame(columns=STREAM_COLUMNS).astype({"日付": "datetime64[ns]"})]
+    return _fold(frames, masters), masters
+
+
+def stream_rollups(source, masters, chunk_rows=CHUNK_ROWS):
+    """データソースを逐次集計して全粒度の集計表を返す
+
+    (集計表の辞書, マスタ) を返す。週次・月次は日次集計表から作る。
+    """
+    daily, masters = stream_daily_rollup(
+        iter_source(source, chunk_rows, columns=STREAM_COLUMNS), masters, chunk_rows
+    )
+    rollups = {
+        "daily": daily,
+        "weekly": build_rollup(daily, "weekly"),
+        "monthly": build_rollup(daily, "monthly"),
+    }
+    return rollups, masters
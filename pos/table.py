@@ -0,0 +1,112 @@
+"""結果の表のページ表示
+
+pandas の Styler は全セルをPythonで書式化するため、行数が多い表では
+表示が遅くなる。ここでは次のようにして、1ページあたり一定の時間で表示する。
+
+- 並べ替えはサーバー側で、数値のままの結果（キャッシュ上のDataFrame）に対して
+  行う。並べ替えた行の順序はセッションに保持し、ページの切り替えでは
+  並べ替えない
+- ブラウザへ送るのは表示中のページの行だけで、書式化もその行だけに行う
+  （列ごとの書式文字列を使う）
+
+行数がページの行数以下の表は、ページ切り替え・並べ替えの操作を表示しない。
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from pos.trace import span
+
+# 1ページあたりの行数
+PAGE_SIZE = 50
+
+# 欠損値の表示
+NA_REP = "-"
+
+# 並べ替えなし（元の順序）を表す選択肢
+ORIGINAL_ORDER = "（元の順序）"
+
+
+def format_frame(df, format_dict, na_rep=NA_REP):
+    """format_dict の列を書式化した文字列に置き換えたDataFrameを返す
+
+    表示する行（1ページ分）だけに使うこと。
+    """
+    formatted = df.copy(deep=False)
+    for column, fmt in format_dict.items():
+        if column in formatted:
+            formatted[column] = [
+                na_rep if pd.isna(value) else fmt.format(value) for value in df[column]
+            ]
+    return formatted
+
+
+def table_height(n_rows, max_height=400):
+    """行数に応じた表の高さ（px）を返す"""
+    return min(n_rows * 35 + 50, max_height)
+
+
+def _sorted_order(df, key, sort_by, descending, data_key=None):
+    """並べ替え後の行の位置を返す（同じ結果・条件の間はセッションに保持）"""
+    if sort_by == ORIGINAL_ORDER:
+        return None
+    state_key = f"{key}_order"
+    # data_key がない場合は、同じオブジェクト（キャッシュ上の結果）かどうかで判定する
+    condition = (id(df) if data_key is None else data_key, len(df), sort_by, descending)
+    cached = st.session_state.get(state_key)
+    if cached is not None and cached[0] == condition:
+        return cached[1]
+    values = df[sort_by]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(str)
+    order = np.argsort(values.to_numpy(), kind="stable")
+    if descending:
+        order = order[::-1]
+    # 欠損値は常に末尾にする
+    missing = values.isna().to_numpy()[order]
+    order = np.concatenate([order[~missing], order[missing]])
+    st.session_state[state_key] = (condition, order)
+    return order
+
+
+def paged_table(df, format_dict, key, data_key=None, page_size=PAGE_SIZE, height=None):
+    """表をページ単位で表示する（Stylerは使わない）
+
+    key はウィジェットとセッションの状態を区別するための文字列。
+    data_key には表の内容を決める条件（日付・店舗など）を渡す。条件が同じ間は
+    並べ替えの結果を再利用する（省略時は df が同じオブジェクトの間だけ再利用）。
+    height を省略した場合は表示する行数から高さを決める。
+    """
+    with span("render", key, rows=len(df)):
+        _paged_table(df, format_dict, key, data_key, page_size, height)
+
+
+def _paged_table(df, format_dict, key, data_key, page_size, height):
+    n_rows = len(df)
+    if n_rows <= page_size:
+        rows = df
+    else:
+        controls = st.columns([3, 1, 1])
+        sort_by = controls[0].selectbox(
+            "並べ替え", [ORIGINAL_ORDER, *df.columns], key=f"{key}_sort_by"
+        )
+        descending = controls[1].toggle("降順", key=f"{key}_descending")
+        n_pages = math.ceil(n_rows / page_size)
+        page = controls[2].number_input(
+            f"ページ（全{n_pages:,}）", min_value=1, max_value=n_pages, value=1,
+            key=f"{key}_page",
+        )
+        start = (int(page) - 1) * page_size
+        stop = min(start + page_size, n_rows)
+        order = _sorted_order(df, key, sort_by, descending, data_key)
+        rows = df.iloc[start:stop] if order is None else df.iloc[order[start:stop]]
+        st.caption(f"{n_rows:,}件中 {start + 1:,}〜{stop:,}件目")
+
+    st.dataframe(
+        format_frame(rows, format_dict),
+        use_container_width=True,
+        hide_index=True,
+        height=table_height(len(rows)) if height is None else height,
+    )
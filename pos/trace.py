@@ -0,0 +1,275 @@
+"""再実行ごとの処理時間の計測
+
+1回の再実行（app.py からページの実行まで）を1つのトレースとし、その中の
+処理を名前付きの区間（span）として記録する。区間の名前は次のいずれか。
+
+- load: データの読み込み（データセット・Parquet・取り込み）
+- filter: 期間・店舗・部門による行の絞り込み
+- aggregate: 集計（期間集計・時間帯別集計・ピボット）
+- compare: 期間比較・KPI
+- render: グラフ・表の描画（ブラウザへ送るデータの作成）
+- page: ページのスクリプト全体
+
+区間には行数（rows）・キャッシュの結果（cache: hit/miss/coalesced）などの
+属性を付けられる。区間は入れ子にでき、集計用のスレッドで実行した処理も
+呼び出し元の区間の子になる。トレースがないスレッド（事前集計など）では
+何も記録しない。
+
+終了したトレースはJSON Lines形式のログ（環境変数 POS_TRACE_LOG、既定は
+logs/pos_trace.jsonl）に1行ずつ追記する。ログは POS_TRACE_LOG_MB（既定10）を
+超えると POS_TRACE_LOG_BACKUPS 世代（既定5）までローテーションする。
+POS_TRACE=0 で計測を無効にできる。環境変数 POS_DEBUG_PANEL=1 または
+URLのクエリ ?debug=1 でサイドバーに計測結果を表示する。
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# 計測するかどうか
+TRACE = os.environ.get("POS_TRACE", "1") == "1"
+
+# ログの保存先（空の場合はログに書かない）
+TRACE_LOG = os.environ.get("POS_TRACE_LOG", "logs/pos_trace.jsonl")
+
+# ログのローテーションの大きさ（MB）と世代数
+TRACE_LOG_BYTES = int(os.environ.get("POS_TRACE_LOG_MB", "10")) * 1024 * 1024
+TRACE_LOG_BACKUPS = int(os.environ.get("POS_TRACE_LOG_BACKUPS", "5"))
+
+# 常にデバッグ表示を出すかどうか
+DEBUG_PANEL = os.environ.get("POS_DEBUG_PANEL", "0") == "1"
+
+# スレッドごとの計測中のトレースと、開いている区間の積み重ね
+_local = threading.local()
+
+
+class Trace:
+    """1回の再実行の区間の記録"""
+
+    def __init__(self, page):
+        self.page = page
+        self.time = datetime.now().isoformat(timespec="milliseconds")
+        self.started = time.perf_counter()
+        self.ms = None
+        self.error = None
+        self.spans = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            return next(self._ids)
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def finish(self, error=None):
+        self.ms = (time.perf_counter() - self.started) * 1000
+        self.error = error
+        # 子の区間の時間を除いた自身の時間
+        children = {}
+        for record in self.spans:
+            if record["parent"] is not None:
+                children[record["parent"]] = children.get(record["parent"], 0) + record["ms"]
+        for record in self.spans:
+            record["self_ms"] = max(record["ms"] - children.get(record["id"], 0), 0)
+        self.spans.sort(key=lambda record: record["start_ms"])
+
+    def summary(self):
+        """区間の名前ごとの自身の時間の合計（ミリ秒）と、キャッシュの結果ごとの件数を返す"""
+        totals = {}
+        cache = {}
+        for record in self.spans:
+            totals[record["name"]] = totals.get(record["name"], 0) + record["self_ms"]
+            if "cache" in record:
+                cache[record["cache"]] = cache.get(record["cache"], 0) + 1
+        return totals, cache
+
+    def to_dict(self):
+        totals, cache = self.summary()
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return {
+            "time": self.time,
+            "page": self.page,
+            "session": ctx.session_id if ctx else None,
+            "ms": round(self.ms, 3),
+            "error": self.error,
+            "totals_ms": {name: round(ms, 3) for name, ms in totals.items()},
+            "cache": cache,
+            "spans": [
+                {key: round(value, 3) if key.endswith("ms") else value
+                 for key, value in record.items()}
+                for record in self.spans
+            ],
+        }
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name, label=None, **attrs):
+    """区間を記録する（区間の記録（辞書）を返し、属性を追加できる）
+
+    計測中のトレースがない場合は記録しない。
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield dict(attrs)
+        return
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    record = {
+        "id": trace.next_id(),
+        "parent": None if parent is None else parent["id"],
+        "depth": 0 if parent is None else parent["depth"] + 1,
+        "name": name,
+        "label": label,
+        **attrs,
+    }
+    started = time.perf_counter()
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        stack.pop()
+        record["start_ms"] = (started - trace.started) * 1000
+        record["ms"] = (time.perf_counter() - started) * 1000
+        trace.add(record)
+
+
+def annotate(**attrs):
+    """開いている最も内側の区間に属性を追加する"""
+    stack = _stack()
+    if stack and getattr(_local, "trace", None) is not None:
+        stack[-1].update(attrs)
+
+
+def current_context():
+    """このスレッドの計測の状態（別のスレッドに引き継ぐためのもの）を返す"""
+    trace = getattr(_local, "trace", None)
+    stack = _stack()
+    return trace, stack[-1] if stack else None
+
+
+@contextmanager
+def attach(context):
+    """別のスレッドの計測の状態を引き継いで実行する（区間は引き継いだ区間の子になる）"""
+    trace, parent = context
+    saved = getattr(_local, "trace", None), _stack()
+    _local.trace = trace
+    _local.stack = [] if parent is None else [parent]
+    try:
+        yield
+    finally:
+        _local.trace, _local.stack = saved
+
+
+@st.cache_resource(show_spinner=False)
+def get_trace_logger():
+    """ローテーションするJSON Linesのログの出力先を返す（ログに書かない設定ならNone）"""
+    if not TRACE_LOG:
+        return None
+    directory = os.path.dirname(TRACE_LOG)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        TRACE_LOG, maxBytes=TRACE_LOG_BYTES, backupCount=TRACE_LOG_BACKUPS, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("pos.trace.log")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [handler]
+    return logger
+
+
+def write_trace(trace):
+    """トレースをログに1行追記する"""
+    logger = get_trace_logger()
+    if logger is not None:
+        logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+
+@contextmanager
+def page_trace(page):
+    """この中の処理をページ page の1回の再実行として計測し、終了時にログに書く
+
+    計測しない設定の場合はNoneを返す。
+    """
+    if not TRACE:
+        yield None
+        return
+    trace = Trace(page)
+    saved = getattr(_local, "trace", None), _stack()
+    _local.trace = trace
+    _local.stack = []
+    error = None
+    try:
+        yield trace
+    except BaseException as e:
+        # st.rerun・st.stop による中断も例外として伝わる
+        error = type(e).__name__
+        raise
+    finally:
+        _local.trace, _local.stack = saved
+        trace.finish(error)
+        write_trace(trace)
+
+
+def debug_panel_enabled():
+    """計測結果を表示するかどうか"""
+    return TRACE and (DEBUG_PANEL or st.query_params.get("debug") == "1")
+
+
+def show_debug_panel(trace):
+    """サイドバーに計測結果（区間ごとの時間・行数・キャッシュ）を表示する"""
+    from pos.cache import get_query_cache, get_query_executor
+
+    if trace is None:
+        return
+    totals, cache = trace.summary()
+    with st.sidebar.expander("処理時間（デバッグ）", expanded=True):
+        st.caption(f"{trace.page}: {trace.ms:,.1f}ms  " + "  ".join(
+            f"{outcome} {count}" for outcome, count in sorted(cache.items())
+        ))
+        st.dataframe(
+            pd.DataFrame(
+                {"区間": list(totals), "時間(ms)": [round(ms, 1) for ms in totals.values()]}
+            ).sort_values("時間(ms)", ascending=False),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.dataframe(
+            pd.DataFrame({
+                "区間": ["　" * record["depth"] + record["name"] for record in trace.spans],
+                "内容": [record["label"] or "" for record in trace.spans],
+                "開始(ms)": [round(record["start_ms"], 1) for record in trace.spans],
+                "時間(ms)": [round(record["ms"], 1) for record in trace.spans],
+                "自身(ms)": [round(record["self_ms"], 1) for record in trace.spans],
+                "行数": [record.get("rows") for record in trace.spans],
+                "キャッシュ": [record.get("cache", "") for record in trace.spans],
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
+        stats = get_query_cache().stats()
+        executor = get_query_executor().stats()
+        st.caption(
+            f"キャッシュ: {stats['entries']:,}件 {stats['bytes'] / 1024 / 1024:,.1f}MB"
+            f"  ヒット {stats['hits']:,}  ミス {stats['misses']:,}"
+            f"  同時実行をまとめた件数 {executor['coalesced']:,}"
+        )
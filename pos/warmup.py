@@ -0,0 +1,199 @@
+"""よく使われる表示の事前集計（キャッシュの暖機）
+
+起動直後やデータの取り込み後は、各ページを最初に開いた利用者が集計を
+待つことになる。ここでは新しい版のデータセットを最初に見つけたときに、
+各ページの既定の表示（当日・当月、全店舗と店舗ごと）をバックグラウンドの
+スレッドプールで集計し、共有キャッシュ（pos.cache）に入れておく。
+
+- 画面表示のための集計を待っているセッションがある間は次の事前集計を
+  始めない（利用者の操作を優先する）
+- 事前集計の途中で新しい版のデータセットになった場合、古い版の残りの
+  事前集計は行わない
+- 進み具合は warmup_status() で取得できる
+
+事前集計する表示（当日・当月は実行時の日付）:
+
+- ホーム: 当月1日〜当日の推移（前月比）・合計・店舗×部門の集計
+- 日次売上実績・日次客数実績: 当日の店舗別、店舗ごとの部門別
+- 日次売上カレンダー: 当月の日別合計（全店舗・店舗ごと）
+- 時間帯別売上実績: 当日の店舗別、店舗ごとの部門別（時間帯別データがある場合）
+
+スレッド数は環境変数 POS_WARMUP_WORKERS（既定は2）、POS_WARMUP=0 で無効にできる。
+
+また、最初のグラフ表示で読み込まれる重いモジュール（altair など）を起動後に
+バックグラウンドで読み込んでおき、最初の利用者の待ち時間から除く
+（環境変数 POS_PRELOAD_MODULES にカンマ区切りで指定、空で無効）。
+"""
+import importlib
+import logging
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from pos.cache import (
+    background_queries,
+    cached_aggregate_range,
+    cached_compare_periods,
+    cached_daily_kpis,
+    get_query_executor,
+)
+from pos.calendar import daily_totals, month_range
+from pos.hourly import hourly_cube, hourly_exists
+
+# 事前集計を行うかどうか
+WARMUP = os.environ.get("POS_WARMUP", "1") == "1"
+
+# 事前集計のスレッド数
+WARMUP_WORKERS = int(os.environ.get("POS_WARMUP_WORKERS", "2"))
+
+# 起動後にバックグラウンドで読み込むモジュール
+PRELOAD_MODULES = [
+    module for module in os.environ.get("POS_PRELOAD_MODULES", "altair").split(",") if module
+]
+
+# 画面表示の集計が終わるのを待つ間隔（秒）
+YIELD_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def warmup_tasks(dataset, today=None):
+    """事前集計の (名前, 関数) のリストを返す（全店舗の表示を先にする）"""
+    today = pd.Timestamp.now().normalize() if today is None else pd.Timestamp(today).normalize()
+    month_start = today.replace(day=1)
+    month_first, month_last = month_range(today.strftime("%Y-%m"))
+    references = ["prev_year", "prev_year_same_weekday"]
+    store_keys = ["店舗ID", "店舗名"]
+    department_keys = ["部門ID", "部門名"]
+
+    def views(stores, keys):
+        tasks = [
+            ("日次売上実績", lambda: cached_daily_kpis(dataset, today, by=keys, stores=stores)),
+            ("日次客数実績", lambda: cached_compare_periods(
+                dataset, today, today, references=references, by=keys,
+                measures=["客数"], stores=stores)),
+            ("日次客数実績", lambda: cached_compare_periods(
+                dataset, month_start, today, references=references, by=keys,
+                measures=["客数"], stores=stores)),
+            ("日次売上カレンダー", lambda: daily_totals(
+                dataset, month_first, month_last, stores=stores)),
+        ]
+        if hourly_exists():
+            tasks.append(("時間帯別売上実績", lambda: hourly_cube(today, by=keys, stores=stores)))
+        return tasks
+
+    tasks = [
+        ("ホーム", lambda: cached_compare_periods(
+            dataset, month_start, today, references=["prev_month"], by=["日付"],
+            measures=["売上金額"])),
+        ("ホーム", lambda: cached_aggregate_range(dataset, month_start, today)),
+        ("ホーム", lambda: cached_aggregate_range(
+            dataset, month_start, today, by=["店舗名", "部門名"])),
+        *views(None, store_keys),
+    ]
+    present = set(dataset.stores)
+    for name in dataset.masters.stores.names:
+        if name in present:
+            tasks.extend(views([name], department_keys))
+    return tasks
+
+
+class CacheWarmer:
+    """データセットの版ごとに一度だけ事前集計を行う"""
+
+    def __init__(self, max_workers=WARMUP_WORKERS):
+        # 終了時に待たなくてよいよう、デーモンスレッドのプールで実行する
+        self._queue = queue.Queue()
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"pos-warmup-{i}", daemon=True).start()
+        self._lock = threading.Lock()
+        self._version = None
+        self._status = {"version": None, "total": 0, "done": 0, "errors": 0,
+                        "started": None, "finished": None}
+
+    def schedule(self, dataset, today=None):
+        """dataset の版の事前集計を登録する（登録済みの版なら何もしない）"""
+        with self._lock:
+            if dataset.version == self._version:
+                return False
+            self._version = dataset.version
+            tasks = warmup_tasks(dataset, today)
+            self._status = {"version": dataset.version, "total": len(tasks), "done": 0,
+                            "errors": 0, "started": time.time(), "finished": None}
+        logger.info("キャッシュの事前集計を開始します（%d件）", len(tasks))
+        for name, task in tasks:
+            self._queue.put((dataset.version, name, task))
+        return True
+
+    def _work(self):
+        while True:
+            self._run(*self._queue.get())
+
+    def _run(self, version, name, task):
+        if version != self._version:
+            # 新しい版の事前集計が登録された
+            return
+        # 画面表示のための集計を優先する
+        executor = get_query_executor()
+        while executor.interactive_pending():
+            time.sleep(YIELD_INTERVAL)
+        error = False
+        try:
+            with background_queries():
+                task()
+        except Exception:
+            error = True
+            logger.exception("事前集計に失敗しました: %s", name)
+        with self._lock:
+            if version != self._status["version"]:
+                return
+            self._status["done"] += 1
+            self._status["errors"] += error
+            if self._status["done"] == self._status["total"]:
+                self._status["finished"] = time.time()
+                logger.info("キャッシュの事前集計が完了しました（%.1f秒）",
+                            self._status["finished"] - self._status["started"])
+
+    def status(self):
+        """進み具合（版・件数・完了件数・失敗件数・開始/完了時刻）を返す"""
+        with self._lock:
+            return dict(self._status)
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache_warmer():
+    """プロセス共有の事前集計の実行器を返す"""
+    return CacheWarmer(WARMUP_WORKERS)
+
+
+def schedule_warmup(dataset):
+    """データセットの版が新しければ事前集計を開始する"""
+    if WARMUP:
+        get_cache_warmer().schedule(dataset)
+
+
+def _import_modules(modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            logger.warning("モジュールを読み込めませんでした: %s", module)
+
+
+@st.cache_resource(show_spinner=False)
+def preload_modules():
+    """PRELOAD_MODULES をバックグラウンドで読み込む（プロセスで一度だけ）"""
+    thread = threading.Thread(
+        target=_import_modules, args=(PRELOAD_MODULES,), name="pos-preload", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def warmup_status():
+    """事前集計の進み具合を返す"""
+    return get_cache_warmer().status()
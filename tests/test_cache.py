@@ -0,0 +1,58 @@
+"""pos.cache のテスト"""
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from pos.cache import cached_aggregate_range, get_query_cache
+from pos.dataset import PosDataset
+from pos.master import build_masters
+from pos.rollup import aggregate_range
+
+
+def _dataset():
+    """3店舗×4部門×60日分のPOSデータのデータセット"""
+    masters = build_masters(3, 4)
+    df = pd.MultiIndex.from_product(
+        [pd.date_range("2025-01-01", periods=60), range(3), range(4)],
+        names=["日付", "店舗", "部門"],
+    ).to_frame(index=False)
+    df["店舗ID"], df["店舗名"] = masters.stores.decode(df.pop("店舗").to_numpy())
+    df["部門ID"], df["部門名"] = masters.departments.decode(df.pop("部門").to_numpy())
+    rng = np.random.default_rng(0)
+    for column in ["売上金額", "客数", "個数"]:
+        df[column] = rng.integers(1, 1000, len(df))
+    return PosDataset("test", "v1", df, masters=masters)
+
+
+class CachedAggregateRangeTest(unittest.TestCase):
+    """キャッシュから返す結果（再集計したものを含む）がキャッシュなしの集計と同じになる"""
+
+    START, END = "2025-01-03", "2025-02-20"
+
+    def setUp(self):
+        get_query_cache().clear()
+        self.addCleanup(get_query_cache().clear)
+        self.dataset = _dataset()
+
+    def assert_same_as_uncached(self, by, cached_by):
+        # cached_by の結果をキャッシュに入れてから by で取得する
+        cached_aggregate_range(self.dataset, self.START, self.END, by=cached_by)
+        result = cached_aggregate_range(self.dataset, self.START, self.END, by=by)
+        expected = aggregate_range(self.dataset.rollups, self.START, self.END, by=by)
+        assert_frame_equal(result, expected)
+
+    def test_same_keys_in_other_order(self):
+        self.assert_same_as_uncached(["部門名", "店舗名"], ["店舗名", "部門名"])
+
+    def test_derived_from_finer_keys(self):
+        self.assert_same_as_uncached(["部門名", "店舗名"], ["日付", "店舗名", "部門名"])
+        self.assert_same_as_uncached(["部門名"], ["日付", "店舗名", "部門名"])
+
+    def test_derived_total(self):
+        self.assert_same_as_uncached([], ["店舗名"])
+
+
+if __name__ == "__main__":
+    unittest.main()
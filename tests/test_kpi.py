@@ -0,0 +1,64 @@
+"""pos.kpi のテスト"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pos.kpi import daily_kpis
+from pos.master import apply_masters, build_masters
+from pos.rollup import build_rollups
+
+
+def _sample():
+    """2店舗×3部門×10日分のPOSデータ（最終日は一部の組み合わせに実績がない）と予算"""
+    masters = build_masters(2, 3)
+    dates = pd.date_range("2025-03-01", "2025-03-10")
+    index = pd.MultiIndex.from_product(
+        [dates, masters.stores.ids, masters.departments.ids], names=["日付", "店舗ID", "部門ID"]
+    ).to_frame(index=False)
+    index = index[~((index["日付"] == dates[-1]) & (index["部門ID"] == masters.departments.ids[0]))]
+    rng = np.random.default_rng(0)
+    df = index.assign(
+        店舗名=lambda d: d["店舗ID"].map(dict(zip(masters.stores.ids, masters.stores.names))),
+        部門名=lambda d: d["部門ID"].map(
+            dict(zip(masters.departments.ids, masters.departments.names))),
+        売上金額=rng.integers(1000, 5000, len(index)),
+        客数=rng.integers(10, 50, len(index)),
+        個数=rng.integers(10, 100, len(index)),
+    )
+    budget = df[["店舗ID", "店舗名", "部門ID", "部門名"]].drop_duplicates().assign(
+        年月="2025-03", 予算金額=100_000)
+    return apply_masters(df, masters), budget, dates[-1]
+
+
+class DailyKpisTest(unittest.TestCase):
+    """集計軸が1つでも複数でも、単純な groupby と同じ値になる"""
+
+    def assert_matches_groupby(self, by):
+        df, budget, date = _sample()
+        result = daily_kpis(build_rollups(df), budget, date, by).set_index(by).sort_index()
+
+        month = df[df["日付"] >= date.replace(day=1)]
+        total = month.groupby(by, observed=True)[["売上金額", "客数"]].sum()
+        today = (
+            df[df["日付"] == date].groupby(by, observed=True)[["売上金額", "客数"]].sum()
+            .reindex(total.index, fill_value=0)
+        )
+        per_day = budget.groupby(by)["予算金額"].sum().reindex(total.index) / date.days_in_month
+
+        np.testing.assert_array_equal(result["当日売上"], today["売上金額"])
+        np.testing.assert_array_equal(result["累計売上"], total["売上金額"])
+        np.testing.assert_array_equal(result["当日客数"], today["客数"])
+        np.testing.assert_allclose(result["予算比"], today["売上金額"] / per_day * 100)
+        np.testing.assert_allclose(
+            result["累計予算比"], total["売上金額"] / (per_day * date.day) * 100)
+
+    def test_single_key(self):
+        self.assert_matches_groupby(["店舗名"])
+
+    def test_multiple_keys(self):
+        self.assert_matches_groupby(["店舗ID", "店舗名"])
+
+
+if __name__ == "__main__":
+    unittest.main()
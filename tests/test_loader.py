@@ -0,0 +1,47 @@
+"""pos.loader・pos.dataset の読み込みのテスト"""
+import os
+import tempfile
+import unittest
+
+from pos.dataset import PosDataset
+from pos.loader import iter_source, read_pos_csv
+from pos.master import build_masters
+from pos.rollup import GRAINS
+from pos.schema import CSV_COLUMNS
+from pos.stream import stream_rollups
+
+
+class EmptySourceTest(unittest.TestCase):
+    """ヘッダーだけのCSVでも行があるときと同じ型で読み込み、空の集計表を作る"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "pos_data.csv")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(",".join(CSV_COLUMNS) + "\n")
+
+    def test_read_pos_csv(self):
+        df = read_pos_csv(self.path)
+        self.assertTrue(df.empty)
+        self.assertEqual(df["日付"].dtype.kind, "M")
+
+    def test_iter_source(self):
+        for chunk in iter_source(self.path, 1000):
+            self.assertEqual(chunk["日付"].dtype.kind, "M")
+
+    def test_memory_dataset(self):
+        dataset = PosDataset(self.path, "v", read_pos_csv(self.path), masters=build_masters())
+        self.assertEqual(sorted(dataset.rollups), sorted(GRAINS))
+        for rollup in dataset.rollups.values():
+            self.assertTrue(rollup.empty)
+
+    def test_stream_dataset(self):
+        rollups, masters = stream_rollups(self.path, build_masters())
+        dataset = PosDataset(self.path, "v", rollups["daily"], rollups, masters, mode="stream")
+        for rollup in dataset.rollups.values():
+            self.assertTrue(rollup.empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
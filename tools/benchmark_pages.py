@@ -0,0 +1,252 @@
+"""ページ単位の性能ベンチマーク
+
+データ規模（行数・店舗数）ごとにPOSデータを生成し、各ページを
+Streamlitの AppTest でヘッドレスに実行する。ページごとに決めた操作
+（日付・店舗の選択など）を順に行い、再実行ごとの所要時間の分位点と
+最大メモリ使用量を測定する。
+
+測定はデータ規模×ページごとに別プロセスで行う（キャッシュとメモリ使用量を
+互いに影響させないため）。結果はベースライン（tools/benchmark_baseline.json）
+と比較し、許容範囲を超えて遅くなった・メモリが増えた項目があれば
+終了コード1で終了する。
+
+使用方法:
+    python -m tools.benchmark_pages                      # 既定の規模で測定し比較
+    python -m tools.benchmark_pages --scales 10k 1m      # 規模を指定
+    python -m tools.benchmark_pages --save-baseline      # 結果をベースラインとして保存
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from tools.generate_mock_data import CSV_PARTITION_ROOT, MANIFEST_FILE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_PATH = os.path.join(ROOT, "tools", "benchmark_baseline.json")
+
+# データ規模（名前: (店舗数, 部門数, 日数)）
+SCALES = {
+    "10k": (5, 10, 200),
+    "100k": (20, 10, 500),
+    "1m": (100, 20, 500),
+    "10m": (500, 20, 1000),
+    "100m": (1000, 100, 1000),
+}
+
+# 既定で測定する規模
+DEFAULT_SCALES = ["10k", "100k", "1m"]
+
+# ベースラインに対する許容倍率
+TOLERANCE = 1.2
+
+
+def _select_index(widget, index):
+    if len(widget.options) > index:
+        widget.select_index(index)
+
+
+def _date_range_of_last_month(at):
+    today = datetime.now().date()
+    at.date_input[0].set_value((today - timedelta(days=30), today))
+
+
+# ページごとの操作（AppTestを受け取り、ウィジェットを操作する関数のリスト）
+PAGE_SCENARIOS = {
+    "home.py": [
+        _date_range_of_last_month,
+        lambda at: at.multiselect[0].set_value(at.multiselect[0].options[:2]),
+        lambda at: at.multiselect[1].set_value(at.multiselect[1].options[:1]),
+        lambda at: at.multiselect[0].set_value([]),
+        lambda at: at.multiselect[1].set_value([]),
+    ],
+    "daily_sales_analysis.py": [
+        lambda at: at.date_input[0].set_value(datetime.now().date() - timedelta(days=1)),
+        lambda at: _select_index(at.selectbox[0], 1),
+        lambda at: _select_index(at.selectbox[0], 0),
+    ],
+    "hourly_sales_analysis.py": [
+        lambda at: at.select_slider[0].set_value(12),
+        lambda at: at.select_slider[0].set_value(18),
+        lambda at: _select_index(at.selectbox[0], 1),
+    ],
+    "daily_customer_analysis.py": [
+        lambda at: at.date_input[0].set_value(datetime.now().date() - timedelta(days=1)),
+        lambda at: _select_index(at.selectbox[0], 1),
+        lambda at: _select_index(at.selectbox[0], 0),
+    ],
+    "daily_sales_calendar.py": [
+        lambda at: _select_index(at.selectbox[0], 0),
+        lambda at: _select_index(at.selectbox[1], 1),
+        lambda at: _select_index(at.selectbox[0], len(at.selectbox[0].options) - 1),
+    ],
+}
+
+
+def write_dataset(workdir, n_stores, n_departments, n_days, seed=0):
+    """workdir/data に今日までの n_days 日分のPOSデータ（日次・時間帯別）を生成し、行数を返す"""
+    end = pd.Timestamp(datetime.now().date())
+    start = end - pd.Timedelta(days=n_days - 1)
+    subprocess.run(
+        [sys.executable, "-m", "tools.generate_mock_data",
+         start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"),
+         "--stores", str(n_stores), "--departments", str(n_departments), "--seed", str(seed)],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        check=True,
+        capture_output=True,
+    )
+    with open(os.path.join(workdir, CSV_PARTITION_ROOT, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)["rows"]
+
+
+def run_page(page, scenario):
+    """ページを実行して操作を行い、再実行ごとの所要時間（秒）を返す"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=600)
+    timings = []
+
+    started = time.perf_counter()
+    at.run()
+    timings.append(time.perf_counter() - started)
+    errors = [str(e.value) for e in at.exception]
+
+    for action in scenario:
+        if errors:
+            break
+        action(at)
+        started = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - started)
+        errors = [str(e.value) for e in at.exception]
+    return timings, errors
+
+
+def _worker(page):
+    """（子プロセス）カレントディレクトリのデータでページを測定する"""
+    sys.path.insert(0, ROOT)
+    timings, errors = run_page(page, PAGE_SCENARIOS[page])
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    warm = timings[1:] or timings
+    print(json.dumps({
+        "cold_s": timings[0],
+        "p50_s": float(np.percentile(warm, 50)),
+        "p95_s": float(np.percentile(warm, 95)),
+        "max_s": float(np.max(warm)),
+        "peak_mb": peak_kb / 1024,
+        "reruns": len(timings),
+        "errors": errors,
+    }))
+
+
+def measure(scale, pages):
+    """指定規模のデータを生成し、各ページを別プロセスで測定する"""
+    n_stores, n_departments, n_days = SCALES[scale]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        n_rows = write_dataset(workdir, n_stores, n_departments, n_days)
+        print(f"[{scale}] {n_rows:,}行 ({n_stores}店舗 × {n_departments}部門 × {n_days}日)")
+
+        for page in pages:
+            completed = subprocess.run(
+                [sys.executable, "-m", "tools.benchmark_pages", "--worker", page],
+                cwd=workdir,
+                env={**os.environ, "PYTHONPATH": ROOT},
+                capture_output=True,
+                text=True,
+            )
+            lines = completed.stdout.strip().splitlines()
+            if completed.returncode != 0 or not lines:
+                results[page] = {"errors": [completed.stderr.strip()[-2000:]]}
+            else:
+                results[page] = json.loads(lines[-1])
+            _print_result(page, results[page])
+    return results
+
+
+def _print_result(page, result):
+    if "p50_s" not in result:
+        print(f"  {page:30s} 失敗: {result['errors']}")
+        return
+    print(
+        f"  {page:30s} 初回 {result['cold_s'] * 1000:8.1f}ms"
+        f"  p50 {result['p50_s'] * 1000:8.1f}ms  p95 {result['p95_s'] * 1000:8.1f}ms"
+        f"  最大メモリ {result['peak_mb']:8.1f}MB"
+        + (f"  エラー: {result['errors']}" if result["errors"] else "")
+    )
+
+
+def compare_with_baseline(results, baseline, tolerance=TOLERANCE):
+    """ベースラインより悪化した項目の説明のリストを返す"""
+    regressions = []
+    for scale, pages in results.items():
+        for page, result in pages.items():
+            base = baseline.get(scale, {}).get(page)
+            if not base or "p50_s" not in base:
+                continue
+            if "p50_s" not in result or result["errors"]:
+                regressions.append(f"{scale} {page}: 実行に失敗しました")
+                continue
+            for metric in ["cold_s", "p50_s", "p95_s", "peak_mb"]:
+                if result[metric] > base[metric] * tolerance:
+                    regressions.append(
+                        f"{scale} {page}: {metric} {base[metric]:.3f} → {result[metric]:.3f}"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ページ単位の性能ベンチマーク")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument("--pages", nargs="+", choices=list(PAGE_SCENARIOS),
+                        default=list(PAGE_SCENARIOS))
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="結果をベースラインとして保存する")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="ベースラインに対する許容倍率")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker)
+        return
+
+    results = {scale: measure(scale, args.pages) for scale in args.scales}
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"ベースラインを {BASELINE_PATH} に保存しました。")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        print("ベースラインがありません（--save-baseline で作成してください）。")
+        return
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("ベースラインより悪化しています:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("ベースラインとの比較: 問題ありません。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""POSデータCSVを年月・店舗単位のParquetデータセットに変換する"""
+import sys
+
+from pos.loader import POS_DATA_PATH, read_pos_csv
+from pos.storage import PARQUET_ROOT, write_pos_parquet
+
+
+def convert_to_parquet(csv_path=POS_DATA_PATH, root=PARQUET_ROOT):
+    """CSVを読み込み、Parquetデータセットとして書き出す"""
+    df = read_pos_csv(csv_path)
+    write_pos_parquet(df, root)
+    print(f'{csv_path} ({len(df):,}行) を {root} に変換しました。')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        print('使用方法: python -m tools.convert_to_parquet [入力CSV] [出力ディレクトリ]')
+        sys.exit(1)
+
+    convert_to_parquet(*sys.argv[1:])
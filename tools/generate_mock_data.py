@@ -1,84 +1,284 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+import argparse
+import hashlib
+import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from pos.budget import BUDGET_COLUMNS, BUDGET_PATH
+from pos.hourly import HOURLY_ROOT, split_hourly
+from pos.loader import get_source_version, read_source
+from pos.master import Masters, build_masters, write_masters
+from pos.schema import CSV_COLUMNS
+from pos.storage import (
+    PARQUET_ROOT, partition_dir, update_version, write_pos_parquet, write_pos_partition,
+)
+
+# CSV出力時のパーティションファイルの保存先
+CSV_PARTITION_ROOT = 'data/pos_partitions'
+
+# 生成内容の一覧（マニフェスト）のファイル名
+MANIFEST_FILE = '_manifest.json'
+
+
+def generate_block(dates, stores, departments, rng):
+    """日付×店舗×部門の売上データをまとめて生成（stores・departments はマスタ）"""
+    n_dates, n_stores, n_departments = len(dates), len(stores), len(departments)
+    n_rows = n_dates * n_stores * n_departments
+
+    # 行の並びは 日付 → 店舗 → 部門
+    date_index = np.repeat(np.arange(n_dates), n_stores * n_departments)
+    store_index = np.tile(np.repeat(np.arange(n_stores), n_departments), n_dates)
+    dept_index = np.tile(np.arange(n_departments), n_dates * n_stores)
 
-# 店舗マスタ
-STORES = {
-    'S001': '東京本店',
-    'S002': '大阪支店',
-    'S003': '名古屋支店',
-    'S004': '福岡支店',
-    'S005': '札幌支店'
-}
-
-# 部門マスタ（全店舗共通）
-DEPARTMENTS = {
-    'D001': '食品',
-    'D002': '飲料',
-    'D003': '菓子',
-    'D004': '日用品',
-    'D005': '衣類',
-    'D006': '化粧品',
-    'D007': '文具',
-    'D008': '家電',
-    'D009': '玩具',
-    'D010': '雑貨'
-}
-
-def generate_daily_sales(date, store_id, dept_id):
-    """1日分の売上データを生成"""
     # 休日（土日）は売上が1.5倍
-    weekend_multiplier = 1.5 if date.weekday() >= 5 else 1.0
-    
+    weekend_multiplier = np.where(dates.weekday >= 5, 1.5, 1.0)[date_index]
+
     # 基本値を設定
-    customers = int(np.random.normal(100, 20) * weekend_multiplier)
-    quantity = int(np.random.normal(300, 50) * weekend_multiplier)
-    amount = int(quantity * np.random.normal(500, 100) * weekend_multiplier)
-    
-    return {
-        '店舗ID': store_id,
-        '店舗名': STORES[store_id],
-        '部門ID': dept_id,
-        '部門名': DEPARTMENTS[dept_id],
-        '日付': date.strftime('%Y-%m-%d'),
+    customers = (rng.normal(100, 20, n_rows) * weekend_multiplier).astype(np.int64)
+    quantity = (rng.normal(300, 50, n_rows) * weekend_multiplier).astype(np.int64)
+    amount = (quantity * rng.normal(500, 100, n_rows) * weekend_multiplier).astype(np.int64)
+
+    store_ids, store_names = stores.decode(store_index)
+    dept_ids, dept_names = departments.decode(dept_index)
+    return pd.DataFrame({
+        '店舗ID': store_ids,
+        '店舗名': store_names,
+        '部門ID': dept_ids,
+        '部門名': dept_names,
+        '日付': dates.strftime('%Y-%m-%d').to_numpy()[date_index],
         '売上金額': amount,
         '客数': customers,
         '個数': quantity
-    }
+    }, columns=CSV_COLUMNS)
+
+
+def generate_budget(block, month_dates, rng):
+    """部門別の月間売上予算を生成（実績の月換算の95%〜110%を千円単位に丸める）"""
+    month = month_dates[0]
+    totals = block.groupby(['店舗ID', '店舗名', '部門ID', '部門名'], observed=True,
+                           sort=False)['売上金額'].sum()
+    scale = month.days_in_month / len(month_dates) * rng.uniform(0.95, 1.10, len(totals))
+    budget = totals.reset_index().drop(columns='売上金額')
+    budget['年月'] = month.strftime('%Y-%m')
+    budget['予算金額'] = np.round(totals.to_numpy() * scale, -3).astype(np.int64)
+    return budget[BUDGET_COLUMNS]
+
+
+def partition_seed(seed, store_index, month):
+    """マスターシードから店舗・月ごとのシードを導出"""
+    return np.random.SeedSequence([seed, store_index, month.year, month.month])
+
+
+def generate_partition(month_dates, store_index, stores, departments, seed, hourly=False):
+    """1店舗・1か月分の売上データを生成（ワーカー数によらず同じ結果になる）
+
+    hourly=True の場合は時間帯別のデータも生成し、(日次, 時間帯別) を返す。
+    """
+    rng = np.random.default_rng(partition_seed(seed, store_index, month_dates[0]))
+    block = generate_block(month_dates, stores.take([store_index]), departments, rng)
+    if not hourly:
+        return block
+    return block, split_hourly(block, rng)
+
+
+def generate_partition_budget(block, month_dates, store_index, seed):
+    """1店舗・1か月分の予算を生成（売上データとは別の乱数列を使う）"""
+    sequence = partition_seed(seed, store_index, month_dates[0]).spawn(1)[0]
+    return generate_budget(block, month_dates, np.random.default_rng(sequence))
+
+
+def iter_months(start_date, end_date):
+    """期間を月ごとの日付に分けて返す"""
+    dates = pd.date_range(start_date, end_date, freq='D')
+    for _, month_dates in dates.groupby(dates.to_period('M')).items():
+        yield pd.DatetimeIndex(month_dates)
 
-def generate_pos_data(start_date, end_date):
-    """指定期間のPOSデータを生成"""
+
+def resolve_seed(seed):
+    """シード未指定時はランダムなマスターシードを決める"""
+    return np.random.SeedSequence().entropy if seed is None else seed
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _partition_entry(path, root, rows):
+    return {'path': os.path.relpath(path, root), 'rows': rows, 'sha256': _file_sha256(path)}
+
+
+def _write_partition(task):
+    """（ワーカー）1パーティションを生成してファイルに書き込む
+
+    マニフェストの項目と、そのパーティションの予算を返す。
+    """
+    root, output_format, hourly, month_dates, store_index, stores, departments, seed = task
+    block = generate_partition(month_dates, store_index, stores, departments, seed, hourly)
+    if hourly:
+        block, hourly_block = block
+    month = month_dates[0].strftime('%Y-%m')
+    store_id = stores.ids[store_index]
+    masters = Masters(stores, departments)
+    if output_format == 'parquet':
+        path = write_pos_partition(block, root, month, store_id, masters)
+    else:
+        directory = partition_dir(root, month, store_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'part-0.csv')
+        block.to_csv(path, index=False, encoding='utf-8')
+    entry = {'年月': month, '店舗ID': store_id, **_partition_entry(path, root, len(block))}
+    if hourly:
+        path = write_pos_partition(hourly_block, HOURLY_ROOT, month, store_id, masters)
+        entry['hourly'] = _partition_entry(path, HOURLY_ROOT, len(hourly_block))
+    return entry, generate_partition_budget(block, month_dates, store_index, seed)
+
+
+def generate_pos_data(start_date, end_date, n_stores=None, n_departments=None,
+                      seed=None, output_format='csv', workers=1, hourly=True):
+    """指定期間のPOSデータを生成
+
+    店舗×月のパーティションに分けて生成し、workers > 1 の場合はプロセス
+    プールで並列に処理する。各パーティションのシードはマスターシードから
+    導出するため、seed を指定すればワーカー数によらず同じバイト列の
+    ファイルができる。メモリ使用量はパーティション数個分に収まる。
+    生成したパーティションの一覧はマニフェスト（_manifest.json）に出力する。
+
+    hourly=True の場合は、日次の値を時間帯（10時〜22時台）に按分した
+    時間帯別データも data/pos_hourly にParquet形式で出力する。
+    店舗×部門×月の売上予算は data/pos_budget.csv に、店舗・部門マスタは
+    data/stores.csv・data/departments.csv に出力する。
+    """
     # 文字列を日付オブジェクトに変換
     start = datetime.strptime(start_date, '%Y-%m-%d')
     end = datetime.strptime(end_date, '%Y-%m-%d')
-    
-    data = []
-    current = start
-    
-    # 指定期間分のデータを生成
-    while current <= end:
-        for store_id in STORES:
-            for dept_id in DEPARTMENTS:
-                data.append(generate_daily_sales(current, store_id, dept_id))
-        current += timedelta(days=1)
-    
-    # DataFrameに変換
-    df = pd.DataFrame(data)
-    
-    # データディレクトリが存在しない場合は作成
+    masters = build_masters(n_stores, n_departments)
+    stores, departments = masters
+    seed = resolve_seed(seed)
+
+    # データディレクトリが存在しない場合は作成し、店舗・部門マスタを書き出す
     os.makedirs('data', exist_ok=True)
-    
-    # CSVとして出力
-    output_file = f'data/pos_data.csv'
-    df.to_csv(output_file, index=False, encoding='utf-8')
-    print(f'データを {output_file} に出力しました。')
+    write_masters(masters)
+
+    # 出力先を作り直す
+    root = PARQUET_ROOT if output_format == 'parquet' else CSV_PARTITION_ROOT
+    for directory in [root, HOURLY_ROOT] if hourly else [root]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+    tasks = [
+        (root, output_format, hourly, month_dates, store_index, stores, departments, seed)
+        for month_dates in iter_months(start, end)
+        for store_index in range(len(stores))
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_write_partition, tasks, chunksize=16))
+    else:
+        results = [_write_partition(task) for task in tasks]
+    partitions = [partition for partition, _ in results]
+
+    # 予算（店舗×部門×月）は1つのCSVにまとめる
+    pd.concat([budget for _, budget in results], ignore_index=True).to_csv(
+        BUDGET_PATH, index=False, encoding='utf-8')
+
+    manifest = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'stores': len(stores),
+        'departments': len(departments),
+        'seed': seed,
+        'format': output_format,
+        'hourly': hourly,
+        'rows': sum(partition['rows'] for partition in partitions),
+        'partitions': partitions,
+    }
+    with open(os.path.join(root, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if hourly:
+        update_version(HOURLY_ROOT)
+    if output_format == 'parquet':
+        update_version(root)
+        output_file = root
+    else:
+        # パーティションを年月・店舗の順に連結して1つのCSVにする
+        output_file = 'data/pos_data.csv'
+        with open(output_file, 'wb') as out:
+            for i, partition in enumerate(partitions):
+                with open(os.path.join(root, partition['path']), 'rb') as f:
+                    if i > 0:
+                        f.readline()  # ヘッダー行を読み飛ばす
+                    shutil.copyfileobj(f, out)
+    print(f'データを {output_file} に出力しました（{manifest["rows"]:,}行、シード {seed}）。')
+
+
+def generate_hourly_data(seed=None, root=HOURLY_ROOT):
+    """現在の日次データ（data/pos_parquet または data/pos_data.csv）から時間帯別データを作り直す
+
+    日次の各行を時間帯に按分して root に書き込む。日次データ・予算のファイルは
+    変更せず、マスタは日次データに未登録の店舗・部門がある場合だけ追加する
+    （時間帯別データの部門はマスタのコードで保存するため）。一時ディレクトリに
+    月ごとに書き込んでから置き換えるため、作成中も元の時間帯別データを読み込める。
+    """
+    seed = resolve_seed(seed)
+    source, _ = get_source_version()
+    daily = read_source(source)
+    rng = np.random.default_rng(seed)
+
+    temporary = f'{root}.tmp-{os.getpid()}'
+    if os.path.exists(temporary):
+        shutil.rmtree(temporary)
+    try:
+        for _, month in daily.groupby(daily['日付'].dt.to_period('M'), sort=True):
+            write_pos_parquet(split_hourly(month, rng), temporary)
+        update_version(temporary)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+    previous = f'{root}.old-{os.getpid()}'
+    if os.path.exists(root):
+        os.replace(root, previous)
+    os.replace(temporary, root)
+    shutil.rmtree(previous, ignore_errors=True)
+    print(f'{source} ({len(daily):,}行) から時間帯別データを {root} に出力しました（シード {seed}）。')
+
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 3:
-        print('使用方法: python generate_mock_data.py 開始日 終了日')
-        print('日付形式: YYYY-MM-DD')
-        sys.exit(1)
-    
-    generate_pos_data(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(
+        description='POSデータのモックを生成',
+        usage='python -m tools.generate_mock_data 開始日 終了日 [オプション]\n'
+              '       python -m tools.generate_mock_data --hourly-only [--seed SEED]'
+    )
+    parser.add_argument('start_date', nargs='?', help='開始日（YYYY-MM-DD）')
+    parser.add_argument('end_date', nargs='?', help='終了日（YYYY-MM-DD）')
+    parser.add_argument('--stores', type=int, help='店舗数（既定: 店舗マスタの件数）')
+    parser.add_argument('--departments', type=int, help='部門数（既定: 部門マスタの件数）')
+    parser.add_argument('--seed', type=int, help='乱数シード（指定すると同じデータを再現）')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='出力形式（parquetは data/pos_parquet に出力）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='並列に生成するプロセス数（既定: CPUコア数）')
+    parser.add_argument('--no-hourly', dest='hourly', action='store_false',
+                        help='時間帯別データ（data/pos_hourly）を生成しない')
+    parser.add_argument('--hourly-only', action='store_true',
+                        help='現在の日次データから時間帯別データだけを作り直す'
+                             '（日次データ・予算は変更しない）')
+    args = parser.parse_args()
+
+    if args.hourly_only:
+        generate_hourly_data(args.seed)
+    elif args.end_date is None:
+        parser.error('開始日と終了日を指定してください')
+    else:
+        generate_pos_data(args.start_date, args.end_date, args.stores, args.departments,
+                          args.seed, args.format, args.workers, args.hourly)
@@ -0,0 +1,230 @@
+"""起動時間（コールドスタート）のプロファイル
+
+ページごとに新しいプロセスを起動し、そのページを最初に表示するまでの
+時間を次の段階に分けて測定する。
+
+- streamlit: Streamlit本体の読み込み
+- app.py: app.py が読み込むモジュールの読み込み
+- ページ: ページのスクリプトが読み込むモジュールの読み込み
+- データ: 共有データセットの読み込み（get_dataset）
+- app.py実行: app.py の最初の実行（取り込み・事前集計の開始など）
+- 初回実行: ページの最初の実行（読み込み済みのモジュール・データを除く）
+- 再実行: ページの2回目の実行
+
+AppTest は st.navigation のページを実行しないため、app.py とページは
+別々に実行して測定する。
+
+各段階で読み込まれたモジュールの時間は python -X importtime の出力から
+集計し、パッケージ（最上位のモジュール名）ごとの合計と、時間のかかった
+モジュールを表示する。初回実行の中で読み込まれたモジュール（実行時に
+遅延して読み込むもの）は「初回実行」に含める。
+
+使用方法:
+    python -m tools.profile_startup                   # カレントディレクトリのデータで測定
+    python -m tools.profile_startup --scale 100k      # 生成したデータで測定
+    python -m tools.profile_startup --pages home.py --top 20
+    python -m tools.profile_startup --json profile.json
+"""
+import argparse
+import ast
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 段階（表示順）
+PHASES = ["streamlit", "app.py", "ページ", "データ", "app.py実行", "初回実行", "再実行"]
+
+# 標準エラー出力に書く段階の区切り
+MARKER = "# phase: "
+
+# 表示するモジュールの数（既定）
+TOP_MODULES = 10
+
+
+def script_imports(path):
+    """スクリプトの最上位で読み込んでいるモジュール名のリストを返す"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return modules
+
+
+def _mark(phase):
+    # -X importtime の出力と順序がずれないよう、バッファを通さずに書く
+    os.write(2, f"{MARKER}{phase}\n".encode("utf-8"))
+
+
+def _worker(page):
+    """（子プロセス）段階ごとの所要時間（ミリ秒）を出力する"""
+    sys.path.insert(0, ROOT)
+    timings = {}
+
+    def timed(phase, function):
+        _mark(phase)
+        started = time.perf_counter()
+        result = function()
+        timings[phase] = (time.perf_counter() - started) * 1000
+        return result
+
+    def import_all(modules):
+        for module in modules:
+            importlib.import_module(module)
+
+    timed("streamlit", lambda: import_all(["streamlit", "streamlit.testing.v1"]))
+    timed("app.py", lambda: import_all(script_imports(os.path.join(ROOT, "app.py"))))
+    timed("ページ", lambda: import_all(script_imports(os.path.join(ROOT, page))))
+
+    from streamlit.testing.v1 import AppTest
+
+    from pos.dataset import get_dataset
+
+    # Streamlitの実行環境の外で呼ぶと警告が出るが、結果は実行時と同じキャッシュに入る
+    dataset = timed("データ", get_dataset)
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+    timed("app.py実行", app.run)
+    at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=600)
+    timed("初回実行", at.run)
+    errors = [str(e.value) for e in [*app.exception, *at.exception]]
+    timed("再実行", at.run)
+    _mark("終了")
+    rows = None if dataset.df is None else len(dataset.df)
+    print(json.dumps({"timings_ms": timings, "rows": rows, "errors": errors}, ensure_ascii=False))
+
+
+def parse_importtime(stderr):
+    """-X importtime の出力を段階ごとの [(モジュール, 自身のμs, 累計のμs), ...] に分ける"""
+    phases = {}
+    current = None
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            current = line[len(MARKER):]
+            phases.setdefault(current, [])
+            continue
+        if current is None or not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # 見出しの行
+            continue
+        phases[current].append(
+            (fields[2].strip(), int(fields[0]), int(fields[1]))
+        )
+    return phases
+
+
+def by_package(records):
+    """パッケージ（最上位のモジュール名）ごとの読み込み時間（ミリ秒）を多い順に返す"""
+    totals = {}
+    for module, self_us, _ in records:
+        package = module.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_page(page, workdir):
+    """ページを別プロセスで測定し、結果の辞書を返す"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "tools.profile_startup", "--worker", page],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"errors": [completed.stderr.strip()[-2000:]]}
+    result = json.loads(lines[-1])
+    imports = parse_importtime(completed.stderr)
+    result["packages_ms"] = {phase: dict(by_package(imports.get(phase, []))) for phase in PHASES}
+    result["modules"] = {
+        phase: [
+            {"module": module, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+            for module, self_us, cumulative_us in imports.get(phase, [])
+        ]
+        for phase in PHASES
+    }
+    return result
+
+
+def _print_result(page, result, top):
+    if "timings_ms" not in result:
+        print(f"{page}: 失敗: {result['errors']}")
+        return
+    timings = result["timings_ms"]
+    total = sum(timings[phase] for phase in PHASES[:-1])
+    rows = "" if result["rows"] is None else f"、{result['rows']:,}行"
+    print(f"{page}（表示まで {total:.0f}ms{rows}）")
+    print("  " + "  ".join(f"{phase} {timings[phase]:.0f}ms" for phase in PHASES))
+    for phase in PHASES[1:-1]:
+        packages = [(name, ms) for name, ms in result["packages_ms"][phase].items() if ms >= 1]
+        if packages:
+            print(f"  {phase}で読み込んだパッケージ: "
+                  + "  ".join(f"{name} {ms:.0f}ms" for name, ms in packages[:top]))
+    modules = sorted(
+        (record for phase in PHASES[1:-1] for record in result["modules"][phase]),
+        key=lambda record: record["self_ms"], reverse=True,
+    )
+    if modules:
+        print("  時間のかかったモジュール（自身の時間）: "
+              + "  ".join(f"{record['module']} {record['self_ms']:.1f}ms"
+                          for record in modules[:top]))
+    if result["errors"]:
+        print(f"  エラー: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間のプロファイル")
+    parser.add_argument("--pages", nargs="+", help="測定するページ（既定は全ページ）")
+    parser.add_argument("--scale",
+                        help="指定した規模のデータを生成して測定する（未指定はカレントディレクトリのデータ）")
+    parser.add_argument("--top", type=int, default=TOP_MODULES,
+                        help="表示するパッケージ・モジュールの数")
+    parser.add_argument("--json", help="結果をJSONファイルに保存する")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker)
+        return
+
+    # 子プロセスで pandas などが先に読み込まれないよう、子プロセスでは読み込まない
+    from tools.benchmark_pages import PAGE_SCENARIOS, SCALES, write_dataset
+
+    pages = args.pages or list(PAGE_SCENARIOS)
+    unknown = [page for page in pages if page not in PAGE_SCENARIOS]
+    if unknown:
+        parser.error(f"未知のページです: {', '.join(unknown)}")
+    if args.scale and args.scale not in SCALES:
+        parser.error(f"未知の規模です: {args.scale}（{', '.join(SCALES)} のいずれか）")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = os.getcwd()
+        if args.scale:
+            workdir = tmp
+            n_rows = write_dataset(workdir, *SCALES[args.scale])
+            print(f"[{args.scale}] {n_rows:,}行")
+        results = {}
+        for page in pages:
+            results[page] = profile_page(page, workdir)
+            _print_result(page, results[page], args.top)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.json} に保存しました。")
+
+
+if __name__ == '__main__':
+    main()